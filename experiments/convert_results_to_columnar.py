@@ -0,0 +1,34 @@
+import argparse
+import glob
+import time
+
+from utils.columnar_results import jsonl_to_columnar, load_columnar_results
+
+# **🔹 默认转换所有实验记录目录下的结果文件**
+RESULTS_PATTERN = "../*_records/results/func*/holdout_*.jsonl"
+
+
+def convert_results_to_columnar(patterns):
+    """ 把已有的 holdout_*.jsonl 结果文件转换为同名 .npz 列式文件 """
+    results_paths = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    if not results_paths:
+        print(f"⚠️ Warning: No results files match {patterns}")
+        return
+
+    for results_path in results_paths:
+        start_time = time.time()
+        npz_path = jsonl_to_columnar(results_path)
+        convert_time = time.time() - start_time
+
+        start_time = time.time()
+        columns = load_columnar_results(npz_path)
+        load_time = time.time() - start_time
+        print(f"✅ {results_path} -> {npz_path}: {len(columns['generation'])} rows, "
+              f"{len(columns['expressions'])} unique expressions "
+              f"(convert {convert_time:.2f}s, load {load_time * 1000:.1f}ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSONL generation logs to columnar .npz files")
+    parser.add_argument("patterns", nargs="*", default=[RESULTS_PATTERN], help="glob patterns of results files")
+    convert_results_to_columnar(parser.parse_args().patterns)
@@ -1,3 +1,4 @@
+import argparse
 import time
 import json
 import os
@@ -7,11 +8,21 @@ from utils.readAndwrite import write_json
 from gp_engine.gp_core import run_gp
 from gp_engine.gp_core import compute_test_fitness
 from utils.config_loader import generate_file_paths
+from utils.logging_config import setup_logging
 
 N_GENERATIONS = 30
 POPULATION_SIZE = 500
 FUNCTION_ID = 4
 NUM_EXPERIMENTS = 1
+N_WORKERS = 1  # >1 时用进程池并行计算适应度
+FITNESS_STORE_PATH = None  # 例如 "../fitness_store/fitness.sqlite"：各实验、各进程共享适应度缓存
+SEMANTIC_DEDUP = False  # True: 探针样本上输出相同的表达式共享适应度，只精确评估一个代表
+COLUMNAR_RESULTS = False  # True: 额外写出同名 .npz 列式结果，表达式列做字典编码
+PROFILE = False  # True: 每代各阶段耗时与计数写入结果文件旁的 *.metrics.jsonl
+POPULATION_EVALUATION = False  # True: 缓存未命中的个体整代送入批量栈式解释器求值
+RACING = False  # True: 大训练集上未命中缓存的个体先在样本前缀上竞速，明显进不了精英的提前终止（需 N_WORKERS = 1）
+LOG_LEVEL = "INFO"  # INFO: 每代一行汇总; DEBUG: 逐个体 / 逐次 LLM 调用明细; WARNING: 只输出异常
+CHECKPOINT_INTERVAL = 5  # 每隔多少代保存一次检查点，0 表示不保存；--resume 从最近的检查点继续
 
 
 # **🔹 解析实验时间日志文件路径**
@@ -24,7 +35,7 @@ HEIGHT_LIMIT = 6
 # **🔹 确保路径存在**
 os.makedirs(os.path.dirname(TIME_LOG_PATH), exist_ok=True)
 
-def run_gp_experiment():
+def run_gp_experiment(resume=False):
     """ 运行 GP 进化实验 """
     experiment_times = {}
 
@@ -44,10 +55,14 @@ def run_gp_experiment():
         toolbox = create_gp_toolbox(HEIGHT_LIMIT,init_method=INIT_METHOD,parsed_trees=parsed_trees, pset=pset)
         # **🔹 运行 GP 进化**
         experiment_start_time = time.time()
-        best_individual = run_gp(N_GENERATIONS, POPULATION_SIZE, toolbox, pset, file_paths)
+        best_individual = run_gp(N_GENERATIONS, POPULATION_SIZE, toolbox, pset, file_paths, n_workers=N_WORKERS,
+                                 fitness_store_path=FITNESS_STORE_PATH, semantic_dedup=SEMANTIC_DEDUP,
+                                 columnar_results=COLUMNAR_RESULTS, profile=PROFILE,
+                                 population_evaluation=POPULATION_EVALUATION,
+                                 checkpoint_interval=CHECKPOINT_INTERVAL, resume=resume, racing=RACING)
 
         # **🔹 计算测试适应度**
-        compute_test_fitness(file_paths, toolbox, pset)
+        compute_test_fitness(file_paths, toolbox, pset, fitness_store_path=FITNESS_STORE_PATH)
         experiment_end_time = time.time()
 
         # **🔹 记录实验耗时**
@@ -59,4 +74,8 @@ def run_gp_experiment():
     print("\n🎉 All experiments completed. Execution times saved.")
 
 if __name__ == "__main__":
-    run_gp_experiment()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="从各实验最近一次保存的检查点继续运行")
+    args = parser.parse_args()
+    setup_logging(LOG_LEVEL)
+    run_gp_experiment(resume=args.resume)
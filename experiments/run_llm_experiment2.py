@@ -1,10 +1,13 @@
+import argparse
 import time
 
 from llm_engine.llm_core import run_llm_gp, compute_test_fitness
 from llm_engine.llm_operators import create_pset, create_llm_toolbox, parse_llm_expressions, parse_gp_expressions, \
     load_all_expressions
 from utils.config_loader import generate_file_paths
-from utils.openai_interface import OpenAIInterface
+from utils.logging_config import setup_logging
+from utils.llm_cache import CachedLLMInterface, LLMResponseCache
+from utils.llm_interface import create_llm_interface
 from utils.readAndwrite import write_json, read_json, read_jsonl
 
 N_GENERATIONS = 30
@@ -12,14 +15,28 @@ POPULATION_SIZE = 500
 FUNCTION_ID = 4
 NUM_EXPERIMENTS = 1
 HEIGHT_LIMIT = 6
+N_WORKERS = 1  # >1 时用进程池并行计算适应度
+FITNESS_STORE_PATH = None  # 例如 "../fitness_store/fitness.sqlite"：各实验、各进程共享适应度缓存
+SEMANTIC_DEDUP = False  # True: 探针样本上输出相同的表达式共享适应度，只精确评估一个代表
+COLUMNAR_RESULTS = False  # True: 额外写出同名 .npz 列式结果，表达式列做字典编码
+PROFILE = False  # True: 每代各阶段耗时与计数写入结果文件旁的 *.metrics.jsonl
+LOG_LEVEL = "INFO"  # INFO: 每代一行汇总; DEBUG: 逐个体 / 逐次 LLM 调用明细; WARNING: 只输出异常
+CHECKPOINT_INTERVAL = 5  # 每隔多少代保存一次检查点，0 表示不保存；--resume 从最近的检查点继续
+LLM_CONCURRENCY = 16  # 每代交叉/变异请求的并发上限
+LLM_BATCH_SIZE = 1  # >1 时每个请求携带多个交叉/变异任务，按槽位解析并逐槽位回退到父代
 # **🔹 解析实验时间日志文件路径**
 INIT_METHOD = "gp"        # gp / llm
 BASE_PATH = "../gp_llm_records"  # gp_records / llm_llm_records
 LLM_PATH = "gp"           # gp / qwen /deepseek / chatgpt ....
 TIME_LOG_PATH = f"{BASE_PATH}/timelogs/func{FUNCTION_ID}/experiment_time_log_func{FUNCTION_ID}.json"
-llm_interface = OpenAIInterface()
+LLM_PROVIDER = "qwen"     # qwen / offline（离线替身，无需网络，用于压测）
+LLM_CACHE_PATH = None     # 如 "../llm_cache/responses.sqlite"；None 表示不使用响应缓存
+LLM_CACHE_REUSE = False   # True: 相同 prompt 复用同一答案; False: 同一次运行内重复 prompt 抽取新样本，重跑时按序命中缓存
+llm_interface = create_llm_interface(LLM_PROVIDER)
+if LLM_CACHE_PATH:
+    llm_interface = CachedLLMInterface(llm_interface, LLMResponseCache(LLM_CACHE_PATH), reuse=LLM_CACHE_REUSE)
 
-def run_llm_experiment():
+def run_llm_experiment(resume=False):
     """ 运行LLM GP实验 """
     experiment_times = {}
 
@@ -39,10 +56,14 @@ def run_llm_experiment():
         # **🔹 运行 GP 进化**
         experiment_start_time = time.time()
 
-        best_individual = run_llm_gp(N_GENERATIONS, POPULATION_SIZE, toolbox, pset, file_paths, parsed_trees, llm_interface)
+        best_individual = run_llm_gp(N_GENERATIONS, POPULATION_SIZE, toolbox, pset, file_paths, parsed_trees, llm_interface,
+                                    n_workers=N_WORKERS, llm_concurrency=LLM_CONCURRENCY,
+                                    fitness_store_path=FITNESS_STORE_PATH, semantic_dedup=SEMANTIC_DEDUP,
+                                    batch_size=LLM_BATCH_SIZE, columnar_results=COLUMNAR_RESULTS, profile=PROFILE,
+                                    checkpoint_interval=CHECKPOINT_INTERVAL, resume=resume)
 
         # **🔹 计算测试适应度**
-        compute_test_fitness(file_paths, toolbox, pset)
+        compute_test_fitness(file_paths, toolbox, pset, fitness_store_path=FITNESS_STORE_PATH)
         experiment_end_time = time.time()
 
         # **🔹 记录实验耗时**
@@ -56,4 +77,8 @@ def run_llm_experiment():
 
 
 if __name__ == "__main__":
-    run_llm_experiment()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="从各实验最近一次保存的检查点继续运行")
+    args = parser.parse_args()
+    setup_logging(LOG_LEVEL)
+    run_llm_experiment(resume=args.resume)
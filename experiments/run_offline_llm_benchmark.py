@@ -0,0 +1,71 @@
+import shutil
+import tempfile
+import time
+
+from llm_engine.llm_core import run_llm_gp
+from llm_engine.llm_evolutionary_operators import collect_llm_generate_expressions
+from llm_engine.llm_operators import create_pset, create_llm_toolbox, load_all_expressions
+from utils.llm_interface import create_llm_interface
+from utils.llm_usage import LLMUsageTracker, set_llm_usage_tracker
+from utils.logging_config import setup_logging
+
+# **🔹 离线替身参数：模拟真实接口的延迟分布与失败率**
+LATENCY_MEDIAN = 1.5      # 秒
+LATENCY_SIGMA = 0.4
+FAILURE_RATE = 0.05
+SEED = 0
+
+N_INIT_EXPRESSIONS = 50
+N_GENERATIONS = 3
+POPULATION_SIZE = 100
+LLM_CONCURRENCY = 16
+LLM_BATCH_SIZE = 1  # >1 时使用批量交叉/变异请求
+LOG_LEVEL = "WARNING"  # 压测时不输出每代汇总，避免终端输出计入耗时
+FUNCTION_ID = 4
+INIT_EXPRESSIONS = f"../data/gp_first_generation_func{FUNCTION_ID}_exp1.jsonl"
+
+
+def run_offline_llm_benchmark():
+    """ 在无网络环境下测量 collect_llm_generate_expressions 与 run_llm_gp 的吞吐量 """
+    llm_interface = create_llm_interface("offline", latency_median=LATENCY_MEDIAN, latency_sigma=LATENCY_SIGMA,
+                                         failure_rate=FAILURE_RATE, seed=SEED)
+
+    init_usage = LLMUsageTracker()
+    set_llm_usage_tracker(init_usage)
+    start_time = time.time()
+    collect_llm_generate_expressions(llm_interface, [], N_INIT_EXPRESSIONS)
+    init_time = time.time() - start_time
+    set_llm_usage_tracker(None)
+    init_summary = init_usage.summary()
+    print(f"✅ init: {N_INIT_EXPRESSIONS} requests in {init_time:.2f}s "
+          f"({N_INIT_EXPRESSIONS / init_time:.2f} req/s), latency {init_summary['latency']}, "
+          f"{init_summary['valid']}/{init_summary['slots']} valid")
+
+    pset = create_pset()
+    parsed_trees = load_all_expressions(INIT_EXPRESSIONS, pset)
+    toolbox = create_llm_toolbox(init_method="gp", parsed_trees=parsed_trees, pset=pset)
+
+    # **🔹 结果写到临时目录，避免污染实验记录**
+    tmp_dir = tempfile.mkdtemp()
+    file_paths = {
+        "train_fitness_cache": f"{tmp_dir}/train_fitness.json",
+        "test_fitness_cache": f"{tmp_dir}/test_fitness.json",
+        "results": f"{tmp_dir}/holdout.jsonl",
+        "train_data": f"../datasets/fitness_cases{FUNCTION_ID}.csv",
+        "test_data": f"../datasets/hold_out{FUNCTION_ID}.csv",
+    }
+    try:
+        start_time = time.time()
+        run_llm_gp(N_GENERATIONS, POPULATION_SIZE, toolbox, pset, file_paths, parsed_trees, llm_interface,
+                   llm_concurrency=LLM_CONCURRENCY, batch_size=LLM_BATCH_SIZE)
+        gp_time = time.time() - start_time
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"✅ run_llm_gp: {N_GENERATIONS} generations x {POPULATION_SIZE} individuals in {gp_time:.2f}s "
+          f"({gp_time / N_GENERATIONS:.2f}s per generation, concurrency={LLM_CONCURRENCY}, "
+          f"batch_size={LLM_BATCH_SIZE})")
+
+
+if __name__ == "__main__":
+    setup_logging(LOG_LEVEL)
+    run_offline_llm_benchmark()
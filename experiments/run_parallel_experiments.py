@@ -0,0 +1,129 @@
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from utils.config_loader import generate_file_paths, load_config
+from utils.logging_config import setup_logging
+from utils.readAndwrite import write_json
+
+CONFIG_PATH = "../configs/gp_sr.yml"
+
+
+def _run_gp(config, file_paths):
+    from gp_engine.gp_core import compute_test_fitness, run_gp
+    from gp_engine.gp_operators import create_gp_toolbox, create_pset, parse_llm_expressions
+
+    gp_config, experiment_config = config["gp"], config["experiment"]
+    pset = create_pset()
+    init_method = experiment_config.get("init_method", "gp")
+    parsed_trees = parse_llm_expressions(file_paths["init_expressions"], pset) if init_method == "llm" else None
+    toolbox = create_gp_toolbox(gp_config.get("height_limit", 6), init_method=init_method,
+                                parsed_trees=parsed_trees, pset=pset)
+    run_gp(gp_config["n_generations"], gp_config["population_size"], toolbox, pset, file_paths,
+           n_workers=gp_config.get("n_workers", 1),
+           population_evaluation=gp_config.get("population_evaluation", False),
+           checkpoint_interval=gp_config.get("checkpoint_interval", 0),
+           resume=config["experiment"].get("resume", False), racing=gp_config.get("racing", False))
+    compute_test_fitness(file_paths, toolbox, pset)
+
+
+def _run_llm(config, file_paths):
+    from llm_engine.llm_core import compute_test_fitness, run_llm_gp
+    from llm_engine.llm_operators import create_llm_toolbox, create_pset, load_all_expressions
+    from utils.llm_interface import create_llm_interface
+
+    gp_config, llm_config = config["gp"], config.get("llm", {})
+    pset = create_pset()
+    parsed_trees = load_all_expressions(file_paths["inheritance_expressions"], pset)
+    toolbox = create_llm_toolbox(init_method=config["experiment"].get("init_method", "gp"),
+                                 parsed_trees=parsed_trees, pset=pset)
+    # LLM 客户端不能跨进程传递，在子进程内创建
+    llm_interface = create_llm_interface(llm_config.get("provider", "qwen"))
+    run_llm_gp(gp_config["n_generations"], gp_config["population_size"], toolbox, pset, file_paths, parsed_trees,
+               llm_interface, n_workers=gp_config.get("n_workers", 1), llm_concurrency=llm_config.get("concurrency", 16),
+               batch_size=llm_config.get("batch_size", 1), checkpoint_interval=gp_config.get("checkpoint_interval", 0),
+               resume=config["experiment"].get("resume", False))
+    compute_test_fitness(file_paths, toolbox, pset)
+
+
+def _records_config(config, engine):
+    """ 按 engine 选择记录路径配置块（gp_records / llm_records），避免 GP 与 LLM-GP 的同编号实验互相覆盖 """
+    key = f"{engine}_records"
+    if key not in config:
+        raise ValueError(f"❌ 配置中缺少 {key}（engine: {engine}）")
+    return config[key]
+
+
+def run_single_experiment(config, experiment_id):
+    """ 子进程内运行一次实验：独立的随机种子与输出路径，返回 (experiment_id, 耗时) """
+    experiment_config = config["experiment"]
+    setup_logging(experiment_config.get("log_level", "INFO"))  # 子进程以 spawn 方式启动时不会继承日志配置
+    function_id = experiment_config["function_id"]
+    seed = experiment_config.get("base_seed", 0) + experiment_id
+    random.seed(seed)
+    np.random.seed(seed)
+
+    engine = experiment_config.get("engine", "gp")
+    file_paths = generate_file_paths(function_id, experiment_id, base_path=_records_config(config, engine)["base_path"],
+                                     llm_path=experiment_config.get("llm_path", "gp"))
+    file_paths["train_data"] = config["datasets"]["train"].format(function_id=function_id)
+    file_paths["test_data"] = config["datasets"]["test"].format(function_id=function_id)
+
+    start_time = time.time()
+    if engine == "gp":
+        _run_gp(config, file_paths)
+    elif engine == "llm":
+        _run_llm(config, file_paths)
+    else:
+        raise ValueError(f"❌ 未知的 engine: {engine}（可选 gp / llm）")
+    return experiment_id, time.time() - start_time
+
+
+def run_parallel_experiments(config_path=CONFIG_PATH, resume=False):
+    """ 按 YAML 配置把各次实验分发到进程池并行运行，汇总各进程的耗时日志；resume=True 时各实验从自己的检查点继续 """
+    config = load_config(config_path)
+    experiment_config = config["experiment"]
+    experiment_config["resume"] = resume
+    function_id = experiment_config["function_id"]
+    num_experiments = experiment_config["num_experiments"]
+    max_parallel = experiment_config.get("max_parallel") or os.cpu_count()
+    engine = experiment_config.get("engine", "gp")
+    time_log_path = _records_config(config, engine)["timelogs"]["experiment_time_log"].format(function_id=function_id)
+
+    print(f"🚀 Running {num_experiments} experiments of func{function_id} "
+          f"({engine}) with {min(max_parallel, num_experiments)} processes...")
+    start_time = time.time()
+    experiment_times = {}
+    failures = {}
+    with ProcessPoolExecutor(max_workers=min(max_parallel, num_experiments)) as executor:
+        futures = {executor.submit(run_single_experiment, config, experiment_id): experiment_id
+                   for experiment_id in range(1, num_experiments + 1)}
+        for future in as_completed(futures):
+            # **单个实验失败不中断其余实验，失败信息在时间日志保存后统一抛出**
+            try:
+                experiment_id, elapsed = future.result()
+            except Exception as e:
+                failures[futures[future]] = e
+                print(f"❌ Experiment {futures[future]} failed: {e!r}")
+                continue
+            experiment_times[experiment_id] = elapsed
+            print(f"✅ Experiment {experiment_id} completed in {elapsed:.2f} seconds.")
+
+    # **🔹 按实验编号汇总并保存已完成实验的时间日志**
+    write_json(time_log_path, {f"experiment_{i}": experiment_times[i] for i in sorted(experiment_times)})
+    if failures:
+        failed = sorted(failures)
+        raise RuntimeError(f"❌ {len(failed)} experiment(s) failed: {failed}") from failures[failed[0]]
+    print(f"\n🎉 All experiments completed in {time.time() - start_time:.2f} seconds. Execution times saved.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run independent GP / LLM-GP experiments in parallel")
+    parser.add_argument("--config", default=CONFIG_PATH, help="path to the YAML experiment config")
+    parser.add_argument("--resume", action="store_true", help="resume each experiment from its latest checkpoint")
+    args = parser.parse_args()
+    run_parallel_experiments(args.config, resume=args.resume)
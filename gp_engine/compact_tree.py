@@ -0,0 +1,194 @@
+import numpy as np
+from deap import gp
+
+# **操作码种类**
+PRIMITIVE, ARGUMENT, TERMINAL, EPHEMERAL, CONSTANT = range(5)
+
+MAX_OPCODES = np.iinfo(np.int8).max + 1
+
+
+class CompactTree:
+    """
+    数组形式的 GP 树：opcodes 为前缀序列的 int8 操作码，consts 依次保存其中常数节点
+    （ephemeral 与 from_string 解析出的数值）的 float64 取值。
+    height 在编码时算好，哈希首次使用时计算后缓存；克隆只需复制两个小数组。
+    """
+
+    __slots__ = ("opcodes", "consts", "height", "_hash")
+
+    def __init__(self, opcodes, consts, height):
+        self.opcodes = opcodes
+        self.consts = consts
+        self.height = height
+        self._hash = None
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    @property
+    def size(self):
+        return len(self.opcodes)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((self.opcodes.tobytes(), self.consts.tobytes()))
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactTree):
+            return NotImplemented
+        return np.array_equal(self.opcodes, other.opcodes) and np.array_equal(self.consts, other.consts)
+
+    def copy(self):
+        clone = CompactTree(self.opcodes.copy(), self.consts.copy(), self.height)
+        clone._hash = self._hash
+        return clone
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    @property
+    def nbytes(self):
+        return self.opcodes.nbytes + self.consts.nbytes
+
+
+class TreeCodec:
+    """
+    由 pset 生成的操作码表，在 PrimitiveTree 与 CompactTree 之间无损转换。
+    操作码依次为：原语、参数终结符、固定终结符（如 -1、1）、各 ephemeral 类，
+    最后两个为 from_string 解析出的整数 / 浮点常数。
+    """
+
+    def __init__(self, pset):
+        self.pset = pset
+        self.nodes = []  # 操作码 -> 原语 / 终结符 / ephemeral 类；常数操作码为其值类型
+        self.kinds = []
+        for primitive in pset.primitives[pset.ret]:
+            self._add(primitive, PRIMITIVE)
+        for terminal in pset.terminals[pset.ret]:
+            if isinstance(terminal, gp.MetaEphemeral):
+                self._add(terminal, EPHEMERAL)
+            elif terminal.conv_fct is str and terminal.value in pset.arguments:
+                self._add(terminal, ARGUMENT)  # renameArguments 只改 value（x1），name 仍为 ARG0
+            else:
+                self._add(terminal, TERMINAL)
+        self.int_opcode = self._add(int, CONSTANT)
+        self.float_opcode = self._add(float, CONSTANT)
+        if len(self.nodes) > MAX_OPCODES:
+            raise ValueError(f"❌ pset 共有 {len(self.nodes)} 种节点，超出 int8 操作码范围 ({MAX_OPCODES})")
+
+        self.kinds = np.asarray(self.kinds, dtype=np.int8)
+        # **每个参数必须恰好对应一个 ARGUMENT 操作码，否则样本列号会错位（参数被当成固定终结符时 arg_index 为 -1）**
+        arguments = sorted(node.value for node, kind in zip(self.nodes, self.kinds) if kind == ARGUMENT)
+        if arguments != sorted(pset.arguments):
+            raise ValueError(f"❌ pset 参数 {pset.arguments} 与识别出的参数终结符 {arguments} 不一致")
+        self.arities = np.asarray([node.arity if kind == PRIMITIVE else 0
+                                   for node, kind in zip(self.nodes, self.kinds)], dtype=np.int8)
+        # **参数终结符对应样本矩阵的列号，其余操作码为 -1**
+        self.arg_index = np.asarray([pset.arguments.index(node.value) if kind == ARGUMENT else -1
+                                     for node, kind in zip(self.nodes, self.kinds)], dtype=np.int64)
+        # **按名称查找：反序列化（进程间传递、检查点）得到的节点不再是 pset 中的同一对象**
+        self._opcode_of = {node.name: code for code, node in enumerate(self.nodes)
+                           if self.kinds[code] in (PRIMITIVE, ARGUMENT, TERMINAL)}
+        self._ephemeral_opcode = {node: code for code, node in enumerate(self.nodes) if self.kinds[code] == EPHEMERAL}
+
+    def _add(self, node, kind):
+        self.nodes.append(node)
+        self.kinds.append(kind)
+        return len(self.nodes) - 1
+
+    def _node_opcode(self, node):
+        code = self._opcode_of.get(node.name)
+        if code is not None and (isinstance(node, gp.Primitive) or node == self.nodes[code]):
+            return code, None
+        if type(node) in self._ephemeral_opcode:
+            return self._ephemeral_opcode[type(node)], node.value
+        # from_string 把 pset 中没有的数值解析为普通 Terminal，按取值类型区分以保证 str() 不变
+        if type(node) is gp.Terminal and type(node.value) in (int, float) and node.conv_fct is repr:
+            return (self.int_opcode if type(node.value) is int else self.float_opcode), node.value
+        raise ValueError(f"❌ 无法编码的节点: {node.name}")
+
+    def encode(self, tree):
+        opcodes = np.empty(len(tree), dtype=np.int8)
+        consts = []
+        for i, node in enumerate(tree):
+            opcodes[i], value = self._node_opcode(node)
+            if value is not None:
+                consts.append(value)
+        return CompactTree(opcodes, np.asarray(consts, dtype=np.float64), tree.height)
+
+    def decode(self, compact, cls=gp.PrimitiveTree):
+        """ 还原为 cls（默认 PrimitiveTree，也可传 creator.Individual）"""
+        nodes = []
+        consts = iter(compact.consts.tolist())
+        for code in compact.opcodes.tolist():
+            kind = self.kinds[code]
+            if kind == EPHEMERAL:
+                ephemeral_class = self.nodes[code]
+                node = ephemeral_class.__new__(ephemeral_class)  # 不调用 __init__，避免重新随机取值
+                node.value = next(consts)
+            elif kind == CONSTANT:
+                value_type = self.nodes[code]
+                node = gp.Terminal(value_type(next(consts)), False, self.pset.ret)
+            else:
+                node = self.nodes[code]
+            nodes.append(node)
+        return cls(nodes)
+
+    def height(self, opcodes):
+        """ 与 PrimitiveTree.height 相同的前缀扫描，只用操作码的元数 """
+        stack = [0]
+        max_depth = 0
+        for arity in self.arities[opcodes].tolist():
+            depth = stack.pop()
+            max_depth = max(max_depth, depth)
+            stack.extend([depth + 1] * arity)
+        return max_depth
+
+
+class PackedPopulation:
+    """
+    整个种群拼接成一段连续缓冲区：第 i 个个体的操作码为 opcodes[offsets[i]:offsets[i + 1]]，
+    常数为 consts[const_offsets[i]:const_offsets[i + 1]]。
+    """
+
+    __slots__ = ("opcodes", "consts", "offsets", "const_offsets", "heights")
+
+    def __init__(self, opcodes, consts, offsets, const_offsets, heights):
+        self.opcodes = opcodes
+        self.consts = consts
+        self.offsets = offsets
+        self.const_offsets = const_offsets
+        self.heights = heights
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """ 返回共享缓冲区的 CompactTree 视图，不复制数据 """
+        return CompactTree(self.opcodes[self.offsets[i]:self.offsets[i + 1]],
+                           self.consts[self.const_offsets[i]:self.const_offsets[i + 1]],
+                           int(self.heights[i]))
+
+    @property
+    def sizes(self):
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+
+def pack_population(trees, codec=None):
+    """ 把 CompactTree 列表（或传入 codec 时的 PrimitiveTree 列表）打包为 PackedPopulation """
+    compacts = [codec.encode(tree) for tree in trees] if codec is not None else list(trees)
+    offsets = np.zeros(len(compacts) + 1, dtype=np.int64)
+    const_offsets = np.zeros(len(compacts) + 1, dtype=np.int64)
+    np.cumsum([len(c.opcodes) for c in compacts], out=offsets[1:])
+    np.cumsum([len(c.consts) for c in compacts], out=const_offsets[1:])
+    opcodes = np.concatenate([c.opcodes for c in compacts]) if compacts else np.empty(0, dtype=np.int8)
+    consts = np.concatenate([c.consts for c in compacts]) if compacts else np.empty(0, dtype=np.float64)
+    heights = np.asarray([c.height for c in compacts], dtype=np.int8)
+    return PackedPopulation(opcodes, consts, offsets, const_offsets, heights)
@@ -1,89 +1,140 @@
-import json
+import logging
+import math
+import os
 import random
 import time
 
-from deap import tools, gp
+from deap import tools
 
+from gp_engine.gp_operators import create_pset
+from utils.columnar_results import ColumnarResultsWriter, annotate_columnar_test_fitness, columnar_results_path
+from utils.checkpoint import cache_delta, individuals_state, load_checkpoint, remove_checkpoint, \
+    restore_individuals, restore_rng_state, rng_state, save_checkpoint
 from utils.data_loader import load_data
-from utils.evaluation import evalSymbReg
-from utils.readAndwrite import read_json, write_json, write_jsonl, write_jsonl2
-
-
-def run_gp(n_gen, pop_size, toolbox, pset, file_paths):
-    start_time = time.time()
-    HEIGHT_LIMIT = 6  # 限制最大树高
-    ELITISM_RATE = 0.01
-    elite_size = max(1, int(pop_size * ELITISM_RATE))
-    # 生成文件路径
-    # file_paths = generate_file_paths(function_id, experiment_id)
-    # 创建GP算法工具箱
-    # 生成初始种群
-    pop = toolbox.population(n=pop_size)
-    hof = tools.HallOfFame(1)  # 记录最优个体
-    # 加载数据
-    X_train, y_train, X_test, y_test = load_data(file_paths)
-
-    # **Step 0: 加载训练适应度缓存**
-    cache_train_fitness = read_json(file_paths["train_fitness_cache"])
-
-    first_generation_saved = False  # 确保第一代只存储一次
-    results_data = []
-
-
-    for gen in range(n_gen):
-        generation_data = []
-        cnt = 0
-        for ind in pop:
-            expression = str(ind)
-            print(f"Expression: {expression}")
-
-            if expression in cache_train_fitness:
-                train_fitness = cache_train_fitness[expression]
+from utils.evaluation import HoldoutFitness, annotate_test_fitness
+from utils.fitness_store import FitnessStore, open_fitness_cache, save_fitness_cache
+from utils.parallel_evaluation import ParallelFitnessEvaluator
+from utils.profiler import NULL_PROFILER, GenerationProfiler, metrics_path, set_profiler
+from utils.racing import RacingEvaluator
+from utils.semantic_dedup import SemanticDeduplicator
+from utils.readAndwrite import write_jsonl, write_jsonl2
+
+logger = logging.getLogger(__name__)
+
+
+def evaluate_population_misses(toolbox, population, cache_train_fitness, X_train, y_train, dedup=None):
+    """ 用 toolbox.evaluate_population 一次计算整代中未命中缓存的表达式，返回新写入缓存的表达式列表 """
+    misses = {}
+    for ind in population:
+        expression = str(ind)
+        if expression not in cache_train_fitness and expression not in misses:
+            misses[expression] = ind
+    if dedup is not None:
+        misses = {expression: misses[expression] for expression in dedup.representatives(misses)}
+    if not misses:
+        return []
+
+    fitness = toolbox.evaluate_population(list(misses.values()), X_train, y_train)
+    for expression, value in zip(misses, fitness.tolist()):
+        cache_train_fitness[expression] = value
+        if dedup is not None:
+            dedup.record(expression, value)
+    return list(misses)
+
+
+def evaluate_generation(pop, toolbox, pset, cache_train_fitness, X_train, y_train, dedup=None,
+                        profiler=NULL_PROFILER, log_expressions=False, racer=None):
+    """
+    为 pop 中每个个体设置训练适应度：命中缓存直接取值，否则求值并写入缓存。
+    返回本代非精确适应度的表达式 -> 记录到结果中的值（语义去重共享得到的适应度、竞速终止时的部分 MSE），
+    供 generation_records 标记；竞速终止的个体选择用适应度为 inf。
+    """
+    approximate = {}
+    raced = set()  # 本代由竞速精确评估的表达式：其重复个体命中缓存时也计入门槛
+    compile_func = toolbox.compile  # 带 LRU 缓存的 gp.compile
+    if racer is not None:
+        # 竞速门槛：先用本代命中缓存的精确适应度确定第 k 好的值
+        racer.start_generation(cache_train_fitness[expression] for expression in map(str, pop)
+                               if expression in cache_train_fitness)
+    for ind in pop:
+        expression = str(ind)
+        if log_expressions:
+            logger.debug("Expression: %s", expression)
+
+        if expression in cache_train_fitness:
+            train_fitness = cache_train_fitness[expression]
+            if expression in raced:
+                racer.record(train_fitness)
+            profiler.count("cache_hits")
+        elif dedup is not None:
+            with profiler.timer("evaluate"):
+                train_fitness, exact = dedup(ind, lambda: toolbox.evaluate(ind, pset, X_train, y_train, compile_func))
+            if exact:
+                cache_train_fitness[expression] = train_fitness
             else:
-                train_fitness, _ = evalSymbReg(ind, pset, X_train, y_train, X_test, y_test)  # 计算适应度
+                approximate[expression] = train_fitness
+            profiler.count("cache_misses")
+        elif racer is not None:
+            with profiler.timer("evaluate"):
+                train_fitness, exact = racer(ind, compile_func)
+            if exact:
                 cache_train_fitness[expression] = train_fitness
-
-            ind.fitness.values = (train_fitness,)
-
-        # **Step 1.5: 记录第一代种群（仅存 expression）**
-        if gen == 0 and not first_generation_saved:
-            first_generation_data = [{"expression": str(ind)} for ind in pop]  # 确保每一行是字典格式
-            write_jsonl2(file_paths["first_generation_cache"], first_generation_data)
-            first_generation_saved = True
-            print("✅ 第一代种群表达式已存储！")
-
-        # 记录当前代的适应度信息
-        for ind in pop:
-            generation_data.append({
-                "generation": gen,
-                "expression": str(ind),
-                "train_fitness": ind.fitness.values[0]
-            })
-
-        # **按 `train_fitness` 排序**
-        generation_data.sort(key=lambda x: x["train_fitness"])
-
-        # **写入 JSONL 文件**
-        results_data.extend(generation_data)
-
-        print(f"Generation {gen} logged.")
-
-        # **Step 3: 进行选择、交叉和变异**
+                raced.add(expression)
+            else:
+                # **部分 MSE 只写入记录；inf 使其进不了精英与名人堂，tournsize=1 的随机父代选择不受影响**
+                approximate[expression] = train_fitness
+                train_fitness = math.inf
+                profiler.count("racing_aborted")
+            profiler.count("cache_misses")
+        else:
+            with profiler.timer("evaluate"):
+                train_fitness = toolbox.evaluate(ind, pset, X_train, y_train, compile_func)  # 只计算训练适应度
+            cache_train_fitness[expression] = train_fitness
+            profiler.count("cache_misses")
+
+        ind.fitness.values = (train_fitness,)
+    return approximate
+
+
+def generation_records(pop, gen, approximate=None):
+    """ 当前代的结果记录，按 `train_fitness` 排序；approximate 中的表达式记其给定值并标为 "exact": false """
+    generation_data = []
+    for ind in pop:
+        expression = str(ind)
+        record = {"generation": gen, "expression": expression, "train_fitness": ind.fitness.values[0]}
+        if approximate and expression in approximate:
+            record["train_fitness"] = approximate[expression]
+            record["exact"] = False
+        generation_data.append(record)
+    generation_data.sort(key=lambda x: x["train_fitness"])
+    return generation_data
+
+
+def evolve_generation(pop, toolbox, pop_size, elite_size, HEIGHT_LIMIT=6, profiler=NULL_PROFILER):
+    """ 选择、交叉、变异与精英替换，原地更新 pop（需已有适应度），返回超过树高的个体数 """
+    cnt = 0
+    with profiler.timer("select"):
         offspring = toolbox.select(pop, len(pop))
+    with profiler.timer("clone"):
         offspring = list(map(toolbox.clone, offspring))
 
-        # **交叉**
+    # **交叉**
+    with profiler.timer("crossover"):
         for child1, child2 in zip(offspring[::2], offspring[1::2]):
             if random.random() < 0.8:
                 child1, child2 = toolbox.mate(child1, child2)
                 del child1.fitness.values, child2.fitness.values
+                profiler.count("crossovers")
 
-        # **变异**
+    # **变异**
+    with profiler.timer("mutation"):
         for mutant in offspring:
             if random.random() < 0.2:
                 mutant, = toolbox.mutate(mutant)
                 del mutant.fitness.values
+                profiler.count("mutations")
 
+    with profiler.timer("replacement"):
         # **Step 3.5: 限制树高**(超限个体用父代替换)
         valid_offspring = []
         for i, ind in enumerate(offspring):
@@ -99,56 +150,203 @@ def run_gp(n_gen, pop_size, toolbox, pset, file_paths):
         offspring = tools.selBest(offspring, min(len(offspring), remaining_size))
 
         pop[:] = elites + offspring  # **更新种群**
-        hof.update(pop)  # **确保最优个体被记录**
-        print(f"超过树高的次数：{cnt}")
-    # **Step 4: 保存训练适应度缓存**
-    write_json(file_paths["train_fitness_cache"], cache_train_fitness)
-    write_jsonl(file_paths["results"], results_data)
+    return cnt
+
+
+def run_gp(n_gen, pop_size, toolbox, pset, file_paths, n_workers=1, fitness_store_path=None,
+           semantic_dedup=False, columnar_results=False, profile=False, population_evaluation=False,
+           checkpoint_interval=0, resume=False, racing=False, racing_z=3.0, racing_min_rows=256,
+           pset_factory=None):
+    start_time = time.time()
+    HEIGHT_LIMIT = 6  # 限制最大树高
+    ELITISM_RATE = 0.01
+    elite_size = max(1, int(pop_size * ELITISM_RATE))
+    if racing and (semantic_dedup or population_evaluation):
+        raise ValueError("❌ racing 不能与 semantic_dedup / population_evaluation 同时启用")
+    if racing and n_workers > 1:
+        raise ValueError("❌ racing 按个体顺序更新门槛，只支持单进程评估（n_workers=1）")
+    # 生成文件路径
+    # file_paths = generate_file_paths(function_id, experiment_id)
+    # 创建GP算法工具箱
+    # **检查点：每 checkpoint_interval 代保存一次；resume=True 且检查点存在时从中断处继续**
+    checkpoint_path = file_paths.get("checkpoint")
+    if checkpoint_interval and not checkpoint_path:
+        raise ValueError("❌ 启用检查点需要 file_paths['checkpoint']")
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    # 生成初始种群
+    hof = tools.HallOfFame(1)  # 记录最优个体
+    if checkpoint is not None:
+        pop = restore_individuals(checkpoint["population"], pset)
+        hof.update(restore_individuals(checkpoint["hof"], pset))
+        logger.info("Resuming from checkpoint %s at generation %d", checkpoint_path, checkpoint["generation"])
+    else:
+        pop = toolbox.population(n=pop_size)
+    # 加载数据
+    X_train, y_train, X_test, y_test = load_data(file_paths)
+
+    # **Step 0: 加载训练适应度缓存（指定 fitness_store_path 时改用跨实验共享的 SQLite 存储）**
+    fitness_store = FitnessStore(fitness_store_path) if fitness_store_path else None
+    cache_train_fitness = open_fitness_cache(fitness_store, file_paths["train_fitness_cache"], X_train, y_train)
+    initial_expressions = set(cache_train_fitness) if isinstance(cache_train_fitness, dict) else set()
+    compile_func = toolbox.compile  # 带 LRU 缓存的 gp.compile
+    # **语义去重：探针样本上输出相同的表达式共享适应度，只精确评估一个代表**
+    dedup = SemanticDeduplicator(compile_func, X_train) if semantic_dedup else None
+    # **竞速评估：未命中缓存的个体在逐块增长的样本前缀上提前淘汰，只有可能进入精英的个体跑完全部样本**
+    # **竞速门槛为本代第 elite_size 好的精确适应度：精英与名人堂是已评估个体上仅有的按适应度选择**
+    racer = RacingEvaluator(X_train, y_train, elite_size, z=racing_z, min_rows=racing_min_rows) if racing else None
+
+    # **分阶段计时：profile=True 时每代指标写入结果文件旁的 *.metrics.jsonl，关闭时为空操作**
+    profiler = GenerationProfiler(metrics_path(file_paths["results"]),
+                                  resume_generation=checkpoint["generation"] if checkpoint is not None else None) \
+        if profile else NULL_PROFILER
+    set_profiler(profiler)
+
+    first_generation_saved = False  # 确保第一代只存储一次
+    results_data = []
+    start_gen = 0
+    if checkpoint is not None:
+        if isinstance(cache_train_fitness, dict):
+            cache_train_fitness.update(checkpoint["cache_delta"])
+        if dedup is not None and checkpoint.get("dedup") is not None:
+            dedup.load_state(checkpoint["dedup"])
+        results_data = checkpoint["results_data"]
+        start_gen = checkpoint["generation"]
+        restore_rng_state(checkpoint["rng"])  # 最后恢复随机数状态，之后的进化与未中断时完全一致
+    # **逐个体明细只在 DEBUG 级别输出；判断放在循环外，默认级别下不产生任何格式化开销**
+    log_expressions = logger.isEnabledFor(logging.DEBUG)
+
+
+    # **并行评估：缓存未命中的个体通过 toolbox.map 分发到进程池，子进程用 pset_factory 重建 pset 并调用同一评估器**
+    parallel_evaluator = None
+    if n_workers > 1 and not population_evaluation:  # 整代批量求值时不再需要进程池
+        parallel_evaluator = ParallelFitnessEvaluator(pset_factory or create_pset, X_train, y_train, n_workers,
+                                                      evaluate=toolbox.evaluate, pset=pset)
+        toolbox.register("map", parallel_evaluator.map)
+    try:
+        for gen in range(start_gen, n_gen):
+            generation_start = time.time()
+            with profiler.timer("evaluation"):
+                if fitness_store is not None:
+                    with profiler.timer("cache_prefetch"):
+                        cache_train_fitness.prefetch(str(ind) for ind in pop)  # 一次查询取回整代缓存
+                if population_evaluation:
+                    # **整代批量求值：未命中缓存的个体一次性送入栈式解释器，下面的循环全部命中缓存**
+                    with profiler.timer("population_evaluate"):
+                        new_expressions = evaluate_population_misses(toolbox, pop, cache_train_fitness,
+                                                                      X_train, y_train, dedup)
+                    profiler.count("population_evaluated", len(new_expressions))
+                elif parallel_evaluator is not None:
+                    with profiler.timer("parallel_evaluate"):
+                        new_expressions = parallel_evaluator.evaluate_misses(toolbox.map, pop, cache_train_fitness, dedup)
+                    profiler.count("parallel_evaluated", len(new_expressions))
+
+                approximate = evaluate_generation(pop, toolbox, pset, cache_train_fitness, X_train, y_train,
+                                                  dedup, profiler, log_expressions, racer)
+                if fitness_store is not None:
+                    with profiler.timer("cache_flush"):
+                        cache_train_fitness.flush()  # 每代提交一次，并行运行的其他实验随即可见
+
+            with profiler.timer("logging"):
+                # **Step 1.5: 记录第一代种群（仅存 expression）**
+                if gen == 0 and not first_generation_saved:
+                    first_generation_data = [{"expression": str(ind)} for ind in pop]  # 确保每一行是字典格式
+                    write_jsonl2(file_paths["first_generation_cache"], first_generation_data)
+                    first_generation_saved = True
+                    logger.info("✅ 第一代种群表达式已存储！")
+
+                # 记录当前代的适应度信息（按 `train_fitness` 排序）
+                generation_data = generation_records(pop, gen, approximate)
+
+                # **写入 JSONL 文件**
+                results_data.extend(generation_data)
+
+
+            # **Step 3: 进行选择、交叉和变异**
+            cnt = evolve_generation(pop, toolbox, pop_size, elite_size, HEIGHT_LIMIT, profiler)
+            hof.update(pop)  # **确保最优个体被记录**
+            profiler.count("height_violations", cnt)
+            if checkpoint_interval and (gen + 1) % checkpoint_interval == 0 and gen < n_gen - 1:
+                with profiler.timer("checkpoint"):
+                    save_checkpoint(checkpoint_path, {
+                        "generation": gen + 1,
+                        "population": individuals_state(pop),
+                        "hof": individuals_state(hof),
+                        "rng": rng_state(),
+                        "cache_delta": cache_delta(cache_train_fitness, initial_expressions),
+                        "dedup": dedup.state() if dedup is not None else None,
+                        "results_data": results_data,
+                    })
+            profiler.end_generation(gen)
+            # **每代一行汇总（INFO）**
+            logger.info("Generation %d: best train fitness %s, 超过树高的次数 %d, %.2fs",
+                        gen, generation_data[0]["train_fitness"], cnt, time.time() - generation_start)
+        # **Step 4: 保存训练适应度缓存**
+        with profiler.timer("results_io"):
+            save_fitness_cache(file_paths["train_fitness_cache"], cache_train_fitness)
+            write_jsonl(file_paths["results"], results_data)
+            if columnar_results:
+                # **可选的列式结果（.npz），供收敛分析快速加载**
+                columnar_writer = ColumnarResultsWriter(columnar_results_path(file_paths["results"]))
+                columnar_writer.append(results_data)
+                columnar_writer.close()
+            remove_checkpoint(checkpoint_path)  # 结果已完整写出，检查点不再需要
+        profiler.close()
+        set_profiler(None)
+    finally:
+        # 中途出错时同样关闭进程池，避免遗留子进程
+        if parallel_evaluator is not None:
+            parallel_evaluator.close()
+            toolbox.register("map", map)
 
     end_time = time.time()
-    print(f"Total time: {end_time - start_time:.2f} seconds")
-    print("\nBest Individual:", hof[0] if len(hof) > 0 else "None")
+    logger.info("Total time: %.2f seconds", end_time - start_time)
+    logger.info("Best Individual: %s", hof[0] if len(hof) > 0 else "None")
+    compile_cache = getattr(compile_func, "func", None)  # toolbox.register 包装成了 partial
+    if hasattr(compile_cache, "stats"):
+        logger.info("Compile cache: %s", compile_cache.stats())
+    evaluator = getattr(toolbox.evaluate, "func", None)
+    if hasattr(evaluator, "stats"):
+        logger.info("Subtree cache: %s", evaluator.stats())
+    if dedup is not None:
+        logger.info("Semantic dedup: %s", dedup.stats())
+    if racer is not None:
+        logger.info("Racing: %s", racer.stats())
+
+    # **最优个体的 hold-out 适应度：按需计算，并写入共享的测试适应度缓存**
+    if len(hof) > 0:
+        test_cache = open_fitness_cache(fitness_store, file_paths["test_fitness_cache"], X_test, y_test)
+        holdout_fitness = HoldoutFitness(pset, X_test, y_test, test_cache, compile_func)
+        logger.info("Best Individual hold-out fitness: %s", holdout_fitness(hof[0]))
+        save_fitness_cache(file_paths["test_fitness_cache"], holdout_fitness.cache)
+    if fitness_store is not None:
+        fitness_store.close()
 
     return hof[0] if len(hof) > 0 else None
 
 
 
 # **计算测试适应度**
-def compute_test_fitness(file_paths, toolbox, pset):
+def compute_test_fitness(file_paths, toolbox, pset, fitness_store_path=None):
     start_time = time.time()
     X_train, y_train, X_test, y_test = load_data(file_paths)
 
-    # **Step 0: 加载测试适应度缓存**
-    cache_test_fitness = read_json(file_paths["test_fitness_cache"])
-
-    updated_data = []
-    jsonl_data = []
-    with open(file_paths["results"], "r") as f:
-        for line in f:
-            entry = json.loads(line)
-            expression = entry["expression"]
-
-            if expression in cache_test_fitness:
-                test_fitness = cache_test_fitness[expression]
-            else:
-                try:
-                    tree = gp.PrimitiveTree.from_string(expression, pset)
-                    _, test_fitness = toolbox.evaluate(tree, pset, X_train, y_train, X_test, y_test)
-                except Exception as e:
-                    print(f"❌ Error processing expression {expression}: {e}")
-                    test_fitness = float("inf")  # 处理异常情况
-
-                cache_test_fitness[expression] = test_fitness
-
-            entry["test_fitness"] = test_fitness
-            updated_data.append(entry)
-            jsonl_data.append(entry)
+    # **Step 0: 加载测试适应度缓存（hold-out 适应度只在这里惰性计算）**
+    fitness_store = FitnessStore(fitness_store_path) if fitness_store_path else None
+    test_cache = open_fitness_cache(fitness_store, file_paths["test_fitness_cache"], X_test, y_test)
+    holdout_fitness = HoldoutFitness(pset, X_test, y_test, test_cache, toolbox.compile,
+                                     getattr(toolbox, "evaluate_population", None))  # 不重复的表达式整批求值
 
-    # **Step 4: 重新写回 JSONL 文件**
-    write_jsonl(file_paths["results"], jsonl_data)
+    # **Step 1-4: 流式处理结果文件，不重复的表达式只计算一次**
+    n_rows, n_unique = annotate_test_fitness(file_paths["results"], holdout_fitness)
+    npz_path = columnar_results_path(file_paths["results"])
+    if os.path.exists(npz_path):
+        annotate_columnar_test_fitness(npz_path, holdout_fitness)  # 同步更新列式结果中的 test_fitness 列
 
     # **Step 5: 保存测试适应度缓存**
-    write_json(file_paths["test_fitness_cache"], cache_test_fitness)
+    save_fitness_cache(file_paths["test_fitness_cache"], holdout_fitness.cache)
+    if fitness_store is not None:
+        fitness_store.close()
 
-    print(f"Test fitness computed in {time.time() - start_time:.2f} seconds")
+    logger.info("Test fitness computed in %.2f seconds (%d rows, %d unique expressions)",
+                time.time() - start_time, n_rows, n_unique)
 
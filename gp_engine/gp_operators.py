@@ -1,3 +1,4 @@
+import logging
 import operator
 import random
 import numpy as np
@@ -6,20 +7,27 @@ import deap.base as base
 import deap.creator as creator
 import deap.tools as tools
 
+from gp_engine.stack_interpreter import PopulationInterpreter
+from utils.compile_cache import CompiledExpressionCache
 from utils.convert_tree2expression import expression_to_tree
-from utils.evaluation import evalSymbReg
+from utils.evaluation import evalTrainFitness
+from utils.subtree_cache import SubtreeMemoEvaluator
 from utils.readAndwrite import read_jsonl
 
+logger = logging.getLogger(__name__)
 
-# **保护性操作**
+
+# **保护性操作**（同时支持标量与 numpy 数组，逐元素语义与原标量版本一致）
 def protect_sqrt(x):
-    return np.sqrt(x) if x >= 0 else 0
+    with np.errstate(invalid="ignore"):
+        return np.where(np.greater_equal(x, 0), np.sqrt(np.abs(x)), 0.0)
 
 def protect_div(x, y):
-    return x / y if y != 0 else 1
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        return np.where(np.not_equal(y, 0), np.divide(x, y), 1.0)
 
 def square(x):
-    return x ** 2
+    return np.square(x)
 
 # 将llm生成的表达式转化为parsed_trees
 def parse_llm_expressions(jsonl_file, pset):
@@ -27,7 +35,7 @@ def parse_llm_expressions(jsonl_file, pset):
     expressions = read_jsonl(jsonl_file)  # 读取 JSONL 文件
 
     if not expressions:
-        print(f"⚠️ Warning: No expressions found in {jsonl_file}")
+        logger.warning("⚠️ Warning: No expressions found in %s", jsonl_file)
         return parsed_trees
 
     for entry in expressions:
@@ -37,9 +45,9 @@ def parse_llm_expressions(jsonl_file, pset):
             tree = gp.PrimitiveTree.from_string(parsed_expr, pset)
             parsed_trees.append(tree)
         except Exception as e:
-            print(f"❌ Error parsing expression {expr}: {e}")
+            logger.error("❌ Error parsing expression %s: %s", expr, e)
 
-    print(f"✅ Loaded {len(parsed_trees)} expressions from {jsonl_file}.")
+    logger.info("✅ Loaded %d expressions from %s.", len(parsed_trees), jsonl_file)
     return parsed_trees
 
 def initIndividual(parsed_trees):
@@ -48,7 +56,7 @@ def initIndividual(parsed_trees):
 def cxOnePointListOfTrees(ind1, ind2):
     HEIGHT_LIMIT = 6
     dec = gp.staticLimit(key=operator.attrgetter("height"), max_value=HEIGHT_LIMIT)
-    print(f"ind 1: {ind1}, ind 2: {ind2}")
+    logger.debug("ind 1: %s, ind 2: %s", ind1, ind2)
     # print(f"type(ind1): {type(ind1)}, type(ind2): {type(ind2)}")
     ind1, ind2 = dec(gp.cxOnePoint)(ind1, ind2)
     # print(f"type(ind1): {type(ind1)}, type(ind2): {type(ind2)}")
@@ -79,7 +87,8 @@ def create_pset():
     pset.addTerminal(1)
     return pset
 
-def create_gp_toolbox(HEIGHT_LIMIT, init_method="gp", parsed_trees=None, pset=None):
+def create_gp_toolbox(HEIGHT_LIMIT, init_method="gp", parsed_trees=None, pset=None, compile_cache_size=4096,
+                      evaluator="compiled", subtree_cache_bytes=256 * 1024 * 1024):
     if pset is None:
         raise ValueError("❌ `pset` 不能为空！请先调用 `create_pset()` 生成 `pset`")
 
@@ -97,8 +106,16 @@ def create_gp_toolbox(HEIGHT_LIMIT, init_method="gp", parsed_trees=None, pset=No
         toolbox.register("individual", initIndividual, parsed_trees)
 
     toolbox.register("population", tools.initRepeat, list, toolbox.individual)
-    toolbox.register('compile', gp.compile, pset=pset)
-    toolbox.register("evaluate", evalSymbReg)
+    toolbox.register('compile', CompiledExpressionCache(pset, maxsize=compile_cache_size))  # 带 LRU 缓存的 gp.compile
+    if evaluator == "compiled":
+        toolbox.register("evaluate", evalTrainFitness)
+    elif evaluator == "subtree":
+        # 子树级语义缓存：每个不同子树在每个数据集上只计算一次
+        toolbox.register("evaluate", SubtreeMemoEvaluator(pset, max_bytes=subtree_cache_bytes))
+    else:
+        raise ValueError(f"❌ 未知的 evaluator: {evaluator}（可选 compiled / subtree）")
+    # **整代批量求值：run_gp(population_evaluation=True) 时用于缓存未命中的个体**
+    toolbox.register("evaluate_population", PopulationInterpreter(pset))
     toolbox.register("select", tools.selTournament, tournsize=1)
     toolbox.register("mate", cxOnePointListOfTrees)
     toolbox.register("mutate", mutUniformListOfTrees, pset=pset)
@@ -0,0 +1,186 @@
+import logging
+import multiprocessing as mp
+import queue
+import random
+import time
+
+import numpy as np
+from deap import creator, gp, tools
+
+from gp_engine.gp_core import evaluate_generation, evaluate_population_misses, evolve_generation, generation_records
+from gp_engine.gp_operators import create_gp_toolbox, create_pset, parse_llm_expressions
+from utils.data_loader import load_data
+from utils.evaluation import HoldoutFitness
+from utils.fitness_store import open_fitness_cache, save_fitness_cache
+from utils.readAndwrite import read_json, write_jsonl, write_jsonl2
+
+logger = logging.getLogger(__name__)
+
+ELITISM_RATE = 0.01
+TOPOLOGIES = ("ring", "random")
+
+
+def migration_targets(n_islands, gen, topology="ring", seed=0):
+    """
+    第 gen 代各岛迁出个体的目标岛：ring 为 i -> i+1；random 为按 (seed, gen) 生成的无不动点置换。
+    每个岛恰好收到一批迁入个体，且所有岛算出的迁移方案相同，结果可复现。
+    """
+    if topology == "ring":
+        return [(i + 1) % n_islands for i in range(n_islands)]
+    if topology != "random":
+        raise ValueError(f"❌ 未知的迁移拓扑: {topology}（可选 {' / '.join(TOPOLOGIES)}）")
+    rng = random.Random(seed * 1000003 + gen)
+    targets = list(range(n_islands))
+    while any(i == target for i, target in enumerate(targets)):
+        rng.shuffle(targets)
+    return targets
+
+
+def _migrate(pop, pset, island_id, targets, inboxes, migration_size):
+    """ 把本岛最优的 migration_size 个个体发往目标岛，再用收到的个体替换本岛最差的个体 """
+    emigrants = [(str(ind), float(ind.fitness.values[0])) for ind in tools.selBest(pop, migration_size)]
+    inboxes[targets[island_id]].put(emigrants)
+    immigrants = inboxes[island_id].get()  # 置换保证每个岛只有一个来源，阻塞等待即可
+
+    # 个体只以表达式字符串跨进程传递，适应度随之带过来，无需重新计算
+    worst = sorted(range(len(pop)), key=lambda i: pop[i].fitness.wvalues)[:len(immigrants)]
+    for i, (expression, fitness) in zip(worst, immigrants):
+        ind = creator.Individual(gp.PrimitiveTree.from_string(expression, pset))
+        ind.fitness.values = (float(fitness),)
+        pop[i] = ind
+
+
+def _island_worker(island_id, n_islands, n_gen, pop_size, file_paths, options, inboxes, result_queue):
+    """ 子进程：在本岛上运行与 run_gp 相同的进化循环，按固定代数与其他岛交换个体 """
+    seed = options["seed"] + island_id
+    random.seed(seed)
+    np.random.seed(seed)
+
+    # pset 含 lambda（临时常数），toolbox 无法 pickle，在子进程内重新构建
+    pset = create_pset()
+    init_method = options["init_method"]
+    parsed_trees = parse_llm_expressions(file_paths["init_expressions"], pset) if init_method == "llm" else None
+    toolbox = create_gp_toolbox(options["height_limit"], init_method=init_method, parsed_trees=parsed_trees, pset=pset)
+
+    X_train, y_train, _, _ = load_data(file_paths)
+    cache_train_fitness = read_json(file_paths["train_fitness_cache"])
+    known_expressions = set(cache_train_fitness)
+    elite_size = max(1, int(pop_size * ELITISM_RATE))
+
+    pop = toolbox.population(n=pop_size)
+    hof = tools.HallOfFame(options["hof_size"])
+    results_data = []
+    for gen in range(n_gen):
+        generation_start = time.time()
+        if options["population_evaluation"]:
+            evaluate_population_misses(toolbox, pop, cache_train_fitness, X_train, y_train)
+        evaluate_generation(pop, toolbox, pset, cache_train_fitness, X_train, y_train)
+        hof.update(pop)
+
+        generation_data = generation_records(pop, gen)
+        for record in generation_data:
+            record["island"] = island_id
+        results_data.extend(generation_data)
+
+        # **每 migration_interval 代迁移一次（最后一代之后不再迁移）**
+        if n_islands > 1 and (gen + 1) % options["migration_interval"] == 0 and gen < n_gen - 1:
+            targets = migration_targets(n_islands, gen, options["topology"], options["seed"])
+            _migrate(pop, pset, island_id, targets, inboxes, options["migration_size"])
+
+        cnt = evolve_generation(pop, toolbox, pop_size, elite_size, options["height_limit"])
+        logger.info("Island %d generation %d: best train fitness %s, 超过树高的次数 %d, %.2fs",
+                    island_id, gen, generation_data[0]["train_fitness"], cnt, time.time() - generation_start)
+
+    new_cache_entries = {e: f for e, f in cache_train_fitness.items() if e not in known_expressions}
+    result_queue.put((island_id, results_data, [(str(ind), float(ind.fitness.values[0])) for ind in hof],
+                      new_cache_entries))
+
+
+def _collect_results(processes, result_queue):
+    """ 先取回结果再 join，避免子进程因队列未读空而无法退出；任一岛异常退出时终止全部进程 """
+    results = {}
+    while len(results) < len(processes):
+        try:
+            island_id, *payload = result_queue.get(timeout=1)
+            results[island_id] = payload
+        except queue.Empty:
+            failed = [i for i, p in enumerate(processes) if p.exitcode not in (None, 0)]
+            if failed:
+                for p in processes:
+                    p.terminate()
+                raise RuntimeError(f"❌ 岛 {failed} 的进程异常退出")
+    for p in processes:
+        p.join()
+    return results
+
+
+def run_island_gp(n_gen, pop_size, toolbox, pset, file_paths, n_islands=4, migration_interval=5, migration_size=5,
+                  topology="ring", seed=0, init_method="gp", HEIGHT_LIMIT=6, population_evaluation=False,
+                  hof_size=1):
+    """
+    岛屿模型：n_islands 个子种群（每个 pop_size 个体）各占一个进程，独立运行 run_gp 的进化循环，
+    每 migration_interval 代把各岛最优的 migration_size 个个体按 ring / random 拓扑迁往其他岛，替换其最差个体。
+    结束后合并各岛的结果（每条记录带 "island" 字段）、训练适应度缓存与名人堂，返回全局最优个体。
+    **各岛子进程不使用传入的 toolbox**：pset 含 lambda 无法 pickle，子进程用 create_pset / create_gp_toolbox
+    按 init_method、HEIGHT_LIMIT 重新构建（init_method="llm" 时从 file_paths["init_expressions"] 解析初始个体），
+    因此 toolbox 上自定义的 evaluate / 变异算子等不会生效。传入的 toolbox / pset 只在主进程中用于重建个体
+    与计算最优个体的 hold-out 适应度（toolbox.compile）。
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"❌ 未知的迁移拓扑: {topology}（可选 {' / '.join(TOPOLOGIES)}）")
+    start_time = time.time()
+    options = {
+        "seed": seed,
+        "init_method": init_method,
+        "height_limit": HEIGHT_LIMIT,
+        "migration_interval": max(1, migration_interval),
+        "migration_size": min(migration_size, pop_size),
+        "topology": topology,
+        "population_evaluation": population_evaluation,
+        "hof_size": hof_size,
+    }
+
+    # **每个岛一个收件队列（底层为管道），迁移时发往目标岛的队列**
+    inboxes = [mp.Queue() for _ in range(n_islands)]
+    result_queue = mp.Queue()
+    processes = [mp.Process(target=_island_worker,
+                            args=(i, n_islands, n_gen, pop_size, file_paths, options, inboxes, result_queue))
+                 for i in range(n_islands)]
+    for p in processes:
+        p.start()
+    results = _collect_results(processes, result_queue)
+
+    # **合并结果：同一代内所有岛的记录按 `train_fitness` 排序（排序稳定，并列时按岛编号）**
+    results_data = [record for i in range(n_islands) for record in results[i][0]]
+    results_data.sort(key=lambda x: (x["generation"], x["train_fitness"]))
+    write_jsonl(file_paths["results"], results_data)
+    write_jsonl2(file_paths["first_generation_cache"],
+                 [{"expression": record["expression"]} for record in results_data if record["generation"] == 0])
+
+    # **合并训练适应度缓存：各岛新增的条目按岛编号依次写入**
+    cache_train_fitness = read_json(file_paths["train_fitness_cache"])
+    for i in range(n_islands):
+        cache_train_fitness.update(results[i][2])
+    save_fitness_cache(file_paths["train_fitness_cache"], cache_train_fitness)
+
+    # **合并名人堂**
+    hof = tools.HallOfFame(hof_size)
+    for i in range(n_islands):
+        champions = []
+        for expression, fitness in results[i][1]:
+            ind = creator.Individual(gp.PrimitiveTree.from_string(expression, pset))
+            ind.fitness.values = (float(fitness),)  # 与拓扑无关，统一为 Python float
+            champions.append(ind)
+        hof.update(champions)
+
+    logger.info("Total time: %.2f seconds (%d islands x %d individuals)", time.time() - start_time, n_islands, pop_size)
+    logger.info("Best Individual: %s", hof[0] if len(hof) > 0 else "None")
+
+    if len(hof) > 0:
+        _, _, X_test, y_test = load_data(file_paths)
+        test_cache = open_fitness_cache(None, file_paths["test_fitness_cache"], X_test, y_test)
+        holdout_fitness = HoldoutFitness(pset, X_test, y_test, test_cache, toolbox.compile)
+        logger.info("Best Individual hold-out fitness: %s", holdout_fitness(hof[0]))
+        save_fitness_cache(file_paths["test_fitness_cache"], holdout_fitness.cache)
+
+    return hof[0] if len(hof) > 0 else None
@@ -0,0 +1,96 @@
+import numpy as np
+
+from gp_engine.compact_tree import ARGUMENT, CONSTANT, EPHEMERAL, PRIMITIVE, TERMINAL, TreeCodec, pack_population
+
+NOP = -1
+
+
+class PopulationInterpreter:
+    """
+    整代种群的批量栈式解释器，注册为 toolbox.evaluate_population。
+
+    所有个体先编码为前缀操作码（CompactTree），右对齐排成 (个体数, 最大长度) 的矩阵，
+    再从右往左逐列执行：每一列按操作码分组，同一操作码的所有个体一次性压栈或出栈计算。
+    操作数栈形状为 (个体数, 栈深, 样本数)，调用的仍是 pset 中的同一批原语，
+    结果与 gp.compile 后逐个求值一致，但 Python 层的开销只与树长和操作码种类有关，与种群大小无关。
+    """
+
+    def __init__(self, pset, max_bytes=64 * 1024 * 1024):
+        self.codec = TreeCodec(pset)
+        self.max_bytes = max_bytes  # 操作数栈的内存上限，超出时把种群分块执行
+        self.functions = [pset.context[node.name] if kind == PRIMITIVE else None
+                          for node, kind in zip(self.codec.nodes, self.codec.kinds)]
+        self._const_kinds = np.isin(self.codec.kinds, (EPHEMERAL, CONSTANT))
+        self._delta = 1 - self.codec.arities.astype(np.int64)  # 逆序执行时每个节点对栈深的增量
+
+    def __call__(self, population, X, y):
+        """ 返回与 population 等长的训练适应度（MSE）向量 """
+        if len(population) == 0:
+            return np.empty(0, dtype=np.float64)
+        packed = pack_population(population, self.codec)
+        # 逆序执行时栈中至多保存每层已算完的兄弟子树：栈深 <= 树高 * (最大元数 - 1) + 1
+        max_stack = int(packed.heights.max()) * max(1, int(self.codec.arities.max()) - 1) + 1
+        chunk_size = max(1, self.max_bytes // (8 * max_stack * X.shape[0]))
+        fitness = np.empty(len(packed), dtype=np.float64)
+        for start in range(0, len(packed), chunk_size):
+            stop = min(start + chunk_size, len(packed))
+            predictions = self.predict(packed, start, stop, X)
+            with np.errstate(all="ignore"):
+                fitness[start:stop] = [np.mean((row - y) ** 2) for row in predictions]
+        return fitness
+
+    def _program_matrix(self, packed, start, stop):
+        """ 把第 start..stop 个体右对齐成 (n, L) 的操作码矩阵与常数矩阵，左侧空位填 NOP """
+        sizes = packed.sizes[start:stop]
+        first, last = packed.offsets[start], packed.offsets[stop]
+        n, length = stop - start, int(sizes.max())
+        opcodes = packed.opcodes[first:last]
+
+        node_consts = np.zeros(len(opcodes), dtype=np.float64)
+        is_const = self._const_kinds[opcodes]
+        node_consts[is_const] = packed.consts[packed.const_offsets[start]:packed.const_offsets[stop]]
+
+        rows = np.repeat(np.arange(n), sizes)
+        cols = np.arange(last - first) - np.repeat(packed.offsets[start:stop] - first, sizes) \
+            + np.repeat(length - sizes, sizes)
+        codes = np.full((n, length), NOP, dtype=np.int64)
+        consts = np.zeros((n, length), dtype=np.float64)
+        codes[rows, cols] = opcodes
+        consts[rows, cols] = node_consts
+        return codes, consts
+
+    def predict(self, packed, start, stop, X):
+        """ 执行 packed 中第 start..stop 个体，返回 (n, 样本数) 的预测矩阵 """
+        codes, consts = self._program_matrix(packed, start, stop)
+        n, length = codes.shape
+        # 栈深上界：逆序执行时栈深的前缀和的最大值
+        delta = np.where(codes == NOP, 0, self._delta[np.maximum(codes, 0)])
+        depth = int(np.cumsum(delta[:, ::-1], axis=1).max())
+        stack = np.empty((n, depth, X.shape[0]), dtype=np.float64)
+        sp = np.zeros(n, dtype=np.int64)
+        kinds, arities, arg_index = self.codec.kinds, self.codec.arities, self.codec.arg_index
+
+        with np.errstate(all="ignore"):
+            for p in range(length - 1, -1, -1):
+                column = codes[:, p]
+                for code in np.unique(column).tolist():
+                    if code == NOP:
+                        continue
+                    idx = np.flatnonzero(column == code)
+                    top = sp[idx]
+                    kind = kinds[code]
+                    if kind == PRIMITIVE:
+                        arity = int(arities[code])
+                        # 逆序执行时第一个参数位于栈顶
+                        args = [stack[idx, top - 1 - a] for a in range(arity)]
+                        stack[idx, top - arity] = self.functions[code](*args)
+                        sp[idx] = top - arity + 1
+                    else:
+                        if kind == ARGUMENT:
+                            stack[idx, top] = X[:, arg_index[code]]
+                        elif kind == TERMINAL:
+                            stack[idx, top] = self.codec.nodes[code].value
+                        else:
+                            stack[idx, top] = consts[idx, p][:, None]
+                        sp[idx] = top + 1
+        return stack[:, 0]
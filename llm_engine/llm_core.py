@@ -1,153 +1,347 @@
 import json
+import logging
+import os
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from deap import tools, gp
+from deap import tools
 
+from llm_engine.llm_operators import create_pset
+from utils.columnar_results import ColumnarResultsWriter, annotate_columnar_test_fitness, columnar_results_path
+from utils.checkpoint import cache_delta, individuals_state, load_checkpoint, remove_checkpoint, \
+    restore_individuals, restore_rng_state, rng_state, save_checkpoint
 from utils.data_loader import load_data
-from utils.evaluation import evalSymbReg
-from utils.readAndwrite import read_json, write_json, write_jsonl
-
-
-def run_llm_gp(n_gen, pop_size, toolbox, pset, file_paths, parsed_trees, llm_interface):
+from utils.evaluation import HoldoutFitness, annotate_test_fitness
+from utils.fitness_store import FitnessStore, open_fitness_cache, save_fitness_cache
+from utils.log_writer import AppendOnlyLogWriter, compact_fitness_cache, \
+    fitness_cache_journal_path, read_fitness_cache
+from utils.parallel_evaluation import ParallelFitnessEvaluator
+from utils.llm_cache import llm_request
+from utils.llm_usage import LLMUsageTracker, set_llm_usage_tracker
+from utils.profiler import NULL_PROFILER, GenerationProfiler, metrics_path, set_profiler
+from utils.semantic_dedup import SemanticDeduplicator
+from utils.readAndwrite import write_jsonl
+
+logger = logging.getLogger(__name__)
+
+
+def _positioned(gen, call_site, func):
+    """ 包装线程池任务：在 llm_request 作用域内执行，响应缓存按 (代数, 调用点, 任务) 而不是完成顺序对应样本 """
+    def task(key):
+        with llm_request(gen, call_site, key):
+            return func(key)
+    return task
+
+
+def run_llm_gp(n_gen, pop_size, toolbox, pset, file_paths, parsed_trees, llm_interface, n_workers=1,
+               llm_concurrency=1, log_fsync=False, fitness_store_path=None,
+               semantic_dedup=False, batch_size=1, columnar_results=False, profile=False,
+               checkpoint_interval=0, resume=False, pset_factory=None):
     start_time = time.time()
     HEIGHT_LIMIT = 6  # 限制最大树高
     ELITISM_RATE = 0.01
     elite_size = max(1, int(pop_size * ELITISM_RATE))
 
-    pop = toolbox.population(n=pop_size)
+    # **检查点：每 checkpoint_interval 代保存一次；resume=True 且检查点存在时从中断处继续，已花费的 LLM 调用不再重复**
+    checkpoint_path = file_paths.get("checkpoint")
+    if checkpoint_interval and not checkpoint_path:
+        raise ValueError("❌ 启用检查点需要 file_paths['checkpoint']")
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
     hof = tools.HallOfFame(1)  # 记录最优个体
+    if checkpoint is not None:
+        pop = restore_individuals(checkpoint["population"], pset)
+        hof.update(restore_individuals(checkpoint["hof"], pset))
+        logger.info("Resuming from checkpoint %s at generation %d", checkpoint_path, checkpoint["generation"])
+    else:
+        pop = toolbox.population(n=pop_size)
     # 加载数据
     X_train, y_train, X_test, y_test = load_data(file_paths)
 
-    # **Step 0: 加载训练适应度缓存**
-    cache_train_fitness = read_json(file_paths["train_fitness_cache"])
-
-    results_data = []
-
-    for gen in range(n_gen):
-        generation_data = []
-        cnt = 0
-        for ind in pop:
-            expression = str(ind)
-            print(f"Expression: {expression}")
-
-            if expression in cache_train_fitness:
-                train_fitness = cache_train_fitness[expression]
-            else:
-                train_fitness, _ = evalSymbReg(ind, pset, X_train, y_train, X_test, y_test)  # 计算适应度
-                cache_train_fitness[expression] = train_fitness
-
-            ind.fitness.values = (train_fitness,)
-
-        # 记录当前代的适应度信息
-        for ind in pop:
-            generation_data.append({
-                "generation": gen,
-                "expression": str(ind),
-                "train_fitness": ind.fitness.values[0]
-            })
-
-        # **按 `train_fitness` 排序**
-        generation_data.sort(key=lambda x: x["train_fitness"])
-
-        # **写入 JSONL 文件**
-        results_data.extend(generation_data)
-        write_jsonl(file_paths["results"], results_data)
-        write_json(file_paths["train_fitness_cache"], cache_train_fitness)
-        print(f"Generation {gen} logged.")
-
-        # **Step 3: 进行选择、交叉和变异**
-        offspring = toolbox.select(pop, len(pop))
-        offspring = list(map(toolbox.clone, offspring))
-
-        '''
-        # **交叉**
-        for child1, child2 in zip(offspring[::2], offspring[1::2]):
-            if random.random() < 0.8:
-                child1, child2 = toolbox.mate(child1, child2, parsed_trees=parsed_trees, llm_interface=llm_interface)
-                del child1.fitness.values, child2.fitness.values
-
-        # **变异**
-        for mutant in offspring:
-            if random.random() < 0.2:
-                mutant, = toolbox.mutate(mutant, llm_interface=llm_interface)
-                del mutant.fitness.values
-
-        # **Step 3.5: 限制树高**(超限个体用父代替换)
-        valid_offspring = []
-        for i, ind in enumerate(offspring):
-            if ind.height <= HEIGHT_LIMIT:
-                valid_offspring.append(ind)
-            else:
-                cnt = cnt + 1
-                valid_offspring.append(pop[i])  # 以父代替换超高个体
-        offspring = valid_offspring
-        '''
-        for i in range(0, len(offspring) - 1, 2):
-            if random.random() < 0.8:
-                offspring[i], offspring[i + 1] = toolbox.mate(offspring[i], offspring[i + 1], parsed_trees=parsed_trees, llm_interface=llm_interface, pset=pset)
-                del offspring[i].fitness.values, offspring[i + 1].fitness.values
-
-        for i in range(len(offspring)):  # 直接索引 `offspring`
-            if random.random() < 0.2:
-                offspring[i], = toolbox.mutate(offspring[i], llm_interface=llm_interface)  # 变异
-                del offspring[i].fitness.values  # 清除适应度，以便重新计算
-
-        offspring[:] = [ind if ind.height <= HEIGHT_LIMIT else pop[i] for i, ind in enumerate(offspring)]
-
-        # elites = tools.selBest(pop, elite_size)
-        # remaining_size = max(0, pop_size - elite_size)
-        # offspring = tools.selTournament(offspring, remaining_size, 3)
-
-        # pop[:] = elites + offspring  # **更新种群**
-        pop[:] = offspring
-        # hof.update(pop)  # **确保最优个体被记录**
-        print(f"超过树高的次数：{cnt}")
-    # **Step 4: 保存训练适应度缓存**
-    # write_json(file_paths["train_fitness_cache"], cache_train_fitness)
-    # write_jsonl(file_paths["results"], results_data)
+    # **Step 0: 加载训练适应度缓存（JSON + 上次运行未合并的增量日志；指定 fitness_store_path 时改用共享存储）**
+    fitness_store = FitnessStore(fitness_store_path) if fitness_store_path else None
+    if fitness_store is not None:
+        cache_train_fitness = open_fitness_cache(fitness_store, None, X_train, y_train)
+    else:
+        cache_train_fitness = read_fitness_cache(file_paths["train_fitness_cache"])
+    cache_journal_path = fitness_cache_journal_path(file_paths["train_fitness_cache"])
+    initial_expressions = set(cache_train_fitness) if isinstance(cache_train_fitness, dict) else set()
+    compile_func = toolbox.compile  # 带 LRU 缓存的 gp.compile
+    # **语义去重：探针样本上输出相同的表达式共享适应度，只精确评估一个代表**
+    dedup = SemanticDeduplicator(compile_func, X_train) if semantic_dedup else None
+
+    # **并行评估：缓存未命中的个体通过 toolbox.map 分发到进程池，子进程用 pset_factory 重建 pset 并调用同一评估器**
+    parallel_evaluator = None
+    if n_workers > 1:
+        parallel_evaluator = ParallelFitnessEvaluator(pset_factory or create_pset, X_train, y_train, n_workers,
+                                                      evaluate=toolbox.evaluate, pset=pset)
+        toolbox.register("map", parallel_evaluator.map)
+
+    # **LLM 变异阶段的并发上限：同一代的交叉/变异请求同时发出**
+    llm_executor = ThreadPoolExecutor(max_workers=max(1, llm_concurrency))
+
+    # **分阶段计时：profile=True 时每代指标写入结果文件旁的 *.metrics.jsonl，关闭时为空操作**
+    profiler = GenerationProfiler(metrics_path(file_paths["results"]),
+                                  resume_generation=checkpoint["generation"] if checkpoint is not None else None) \
+        if profile else NULL_PROFILER
+    set_profiler(profiler)
+
+    # **LLM 用量统计：按调用点记录 token、延迟与有效子代数**
+    llm_usage = LLMUsageTracker()
+    set_llm_usage_tracker(llm_usage)
+
+    # **追加写日志：每代只写本代记录与新增缓存条目，由后台线程批量落盘**
+    log_writer = AppendOnlyLogWriter(fsync=log_fsync)
+    # **可选的列式结果（.npz），与 JSONL 同时写出，供收敛分析快速加载**
+    columnar_writer = ColumnarResultsWriter(columnar_results_path(file_paths["results"])) if columnar_results else None
+    start_gen = 0
+    if checkpoint is not None:
+        # 结果文件截回检查点时的长度，丢弃中断那一代之后写出的记录
+        with open(file_paths["results"], "r+") as f:
+            f.truncate(checkpoint["results_offset"])
+        if columnar_writer is not None:
+            with open(file_paths["results"], "r") as f:
+                columnar_writer.append(json.loads(line) for line in f)
+        if isinstance(cache_train_fitness, dict):
+            cache_train_fitness.update(checkpoint["cache_delta"])
+        if dedup is not None and checkpoint.get("dedup") is not None:
+            dedup.load_state(checkpoint["dedup"])
+        llm_usage.records = checkpoint["llm_usage"]
+        start_gen = checkpoint["generation"]
+        restore_rng_state(checkpoint["rng"])  # 最后恢复随机数状态
+    else:
+        write_jsonl(file_paths["results"], [])  # 清空上次的结果文件
+    # **逐个体明细只在 DEBUG 级别输出；判断放在循环外，默认级别下不产生任何格式化开销**
+    log_expressions = logger.isEnabledFor(logging.DEBUG)
+
+    try:
+        for gen in range(start_gen, n_gen):
+            generation_start = time.time()
+            generation_data = []
+            new_cache_entries = []
+            approximate = set()  # 本代语义去重共享得到的（非精确）适应度
+            cnt = 0
+            with profiler.timer("evaluation"):
+                if fitness_store is not None:
+                    with profiler.timer("cache_prefetch"):
+                        cache_train_fitness.prefetch(str(ind) for ind in pop)  # 一次查询取回整代缓存
+                if parallel_evaluator is not None:
+                    with profiler.timer("parallel_evaluate"):
+                        new_expressions = parallel_evaluator.evaluate_misses(toolbox.map, pop, cache_train_fitness, dedup)
+                    new_cache_entries.extend({"expression": e, "fitness": cache_train_fitness[e]} for e in new_expressions)
+                    profiler.count("parallel_evaluated", len(new_expressions))
+
+                for ind in pop:
+                    expression = str(ind)
+                    if log_expressions:
+                        logger.debug("Expression: %s", expression)
+
+                    if expression in cache_train_fitness:
+                        train_fitness = cache_train_fitness[expression]
+                        profiler.count("cache_hits")
+                    elif dedup is not None:
+                        with profiler.timer("evaluate"):
+                            train_fitness, exact = dedup(ind, lambda: toolbox.evaluate(ind, pset, X_train, y_train, compile_func))
+                        if exact:
+                            cache_train_fitness[expression] = train_fitness
+                            new_cache_entries.append({"expression": expression, "fitness": train_fitness})
+                        else:
+                            approximate.add(expression)
+                        profiler.count("cache_misses")
+                    else:
+                        with profiler.timer("evaluate"):
+                            train_fitness = toolbox.evaluate(ind, pset, X_train, y_train, compile_func)  # 只计算训练适应度
+                        cache_train_fitness[expression] = train_fitness
+                        new_cache_entries.append({"expression": expression, "fitness": train_fitness})
+                        profiler.count("cache_misses")
+
+                    ind.fitness.values = (train_fitness,)
+
+            with profiler.timer("logging"):
+                # 记录当前代的适应度信息
+                for ind in pop:
+                    record = {
+                        "generation": gen,
+                        "expression": str(ind),
+                        "train_fitness": ind.fitness.values[0]
+                    }
+                    if record["expression"] in approximate:
+                        record["exact"] = False
+                    generation_data.append(record)
+
+                # **按 `train_fitness` 排序**
+                generation_data.sort(key=lambda x: x["train_fitness"])
+
+                # **追加写入 JSONL 文件（只写本代记录和新增缓存条目）**
+                log_writer.append(file_paths["results"], generation_data)
+                if columnar_writer is not None:
+                    columnar_writer.append(generation_data)
+                if fitness_store is not None:
+                    cache_train_fitness.flush()  # 共享存储本身即事务性的，不需要增量日志
+                else:
+                    log_writer.append(cache_journal_path, new_cache_entries)
+
+            # **Step 3: 进行选择、交叉和变异**
+            llm_usage.generation = gen
+            with profiler.timer("select"):
+                offspring = toolbox.select(pop, len(pop))
+            with profiler.timer("clone"):
+                offspring = list(map(toolbox.clone, offspring))
+
+            '''
+            # **交叉**
+            for child1, child2 in zip(offspring[::2], offspring[1::2]):
+                if random.random() < 0.8:
+                    child1, child2 = toolbox.mate(child1, child2, parsed_trees=parsed_trees, llm_interface=llm_interface)
+                    del child1.fitness.values, child2.fitness.values
+
+            # **变异**
+            for mutant in offspring:
+                if random.random() < 0.2:
+                    mutant, = toolbox.mutate(mutant, llm_interface=llm_interface)
+                    del mutant.fitness.values
+
+            # **Step 3.5: 限制树高**(超限个体用父代替换)
+            valid_offspring = []
+            for i, ind in enumerate(offspring):
+                if ind.height <= HEIGHT_LIMIT:
+                    valid_offspring.append(ind)
+                else:
+                    cnt = cnt + 1
+                    valid_offspring.append(pop[i])  # 以父代替换超高个体
+            offspring = valid_offspring
+            '''
+            # **交叉：先按原顺序抽取本代全部交叉决策，再并发调用 LLM，按原位置组装子代**
+            crossover_ids = [i for i in range(0, len(offspring) - 1, 2) if random.random() < 0.8]
+            with profiler.timer("crossover"):
+                if batch_size > 1:
+                    # **批量模式：每个请求携带 batch_size 对父代**
+                    batches = [crossover_ids[k:k + batch_size] for k in range(0, len(crossover_ids), batch_size)]
+                    children = [pair for batch_children in llm_executor.map(_positioned(gen, "crossover",
+                        lambda ids: toolbox.mate_batch([(offspring[i], offspring[i + 1]) for i in ids],
+                                                       parsed_trees=parsed_trees, llm_interface=llm_interface, pset=pset)),
+                        batches) for pair in batch_children]
+                else:
+                    children = llm_executor.map(_positioned(gen, "crossover",
+                        lambda i: toolbox.mate(offspring[i], offspring[i + 1], parsed_trees=parsed_trees, llm_interface=llm_interface, pset=pset)),
+                        crossover_ids)
+                for i, (child1, child2) in zip(crossover_ids, children):
+                    offspring[i], offspring[i + 1] = child1, child2
+                    del offspring[i].fitness.values, offspring[i + 1].fitness.values
+            profiler.count("crossovers", len(crossover_ids))
+
+            # **变异：作用在交叉后的子代上，同样整批并发**
+            mutation_ids = [i for i in range(len(offspring)) if random.random() < 0.2]
+            with profiler.timer("mutation"):
+                if batch_size > 1:
+                    batches = [mutation_ids[k:k + batch_size] for k in range(0, len(mutation_ids), batch_size)]
+                    mutants = [mutant for batch_mutants in llm_executor.map(_positioned(gen, "mutation",
+                        lambda ids: toolbox.mutate_batch([offspring[i] for i in ids], llm_interface=llm_interface)),
+                        batches) for mutant in batch_mutants]
+                else:
+                    mutants = llm_executor.map(_positioned(gen, "mutation",
+                        lambda i: toolbox.mutate(offspring[i], llm_interface=llm_interface)), mutation_ids)
+                for i, (mutant,) in zip(mutation_ids, mutants):
+                    offspring[i] = mutant  # 变异
+                    del offspring[i].fitness.values  # 清除适应度，以便重新计算
+            profiler.count("mutations", len(mutation_ids))
+
+            with profiler.timer("replacement"):
+                cnt = sum(ind.height > HEIGHT_LIMIT for ind in offspring)
+                offspring[:] = [ind if ind.height <= HEIGHT_LIMIT else pop[i] for i, ind in enumerate(offspring)]
+
+            # elites = tools.selBest(pop, elite_size)
+            # remaining_size = max(0, pop_size - elite_size)
+            # offspring = tools.selTournament(offspring, remaining_size, 3)
+
+            # pop[:] = elites + offspring  # **更新种群**
+            pop[:] = offspring
+            # hof.update(pop)  # **确保最优个体被记录**
+            profiler.count("height_violations", cnt)
+            if checkpoint_interval and (gen + 1) % checkpoint_interval == 0 and gen < n_gen - 1:
+                with profiler.timer("checkpoint"):
+                    log_writer.flush()  # 结果与缓存增量日志先落盘，再记录结果文件长度
+                    save_checkpoint(checkpoint_path, {
+                        "generation": gen + 1,
+                        "population": individuals_state(pop),
+                        "hof": individuals_state(hof),
+                        "rng": rng_state(),
+                        "cache_delta": cache_delta(cache_train_fitness, initial_expressions),
+                        "dedup": dedup.state() if dedup is not None else None,
+                        "results_offset": os.path.getsize(file_paths["results"]),
+                        "llm_usage": list(llm_usage.records),
+                    })
+            profiler.end_generation(gen)
+            # **每代一行汇总（INFO）**
+            logger.info("Generation %d: best train fitness %s, 超过树高的次数 %d, %.2fs",
+                        gen, generation_data[0]["train_fitness"], cnt, time.time() - generation_start)
+        # **Step 4: 等待日志落盘，并把增量日志合并回训练适应度缓存**
+        with profiler.timer("results_io"):
+            log_writer.close()
+            if columnar_writer is not None:
+                columnar_writer.close()
+            if fitness_store is None:
+                compact_fitness_cache(file_paths["train_fitness_cache"], cache_train_fitness)
+            remove_checkpoint(checkpoint_path)  # 结果已完整写出，检查点不再需要
+        profiler.close()
+        set_profiler(None)
+        set_llm_usage_tracker(None)
+        llm_usage_summary = llm_usage.write(file_paths["results"])
+    finally:
+        # 中途出错（如 LLM 请求异常）时同样关闭线程池、进程池与后台日志线程，未开始的请求直接取消
+        llm_executor.shutdown(cancel_futures=True)
+        log_writer.close()
+        if parallel_evaluator is not None:
+            parallel_evaluator.close()
+            toolbox.register("map", map)
 
     end_time = time.time()
-    print(f"Total time: {end_time - start_time:.2f} seconds")
-    print("\nBest Individual:", hof[0] if len(hof) > 0 else "None")
+    logger.info("Total time: %.2f seconds", end_time - start_time)
+    logger.info("Best Individual: %s", hof[0] if len(hof) > 0 else "None")
+    compile_cache = getattr(compile_func, "func", None)  # toolbox.register 包装成了 partial
+    if hasattr(compile_cache, "stats"):
+        logger.info("Compile cache: %s", compile_cache.stats())
+    evaluator = getattr(toolbox.evaluate, "func", None)
+    if hasattr(evaluator, "stats"):
+        logger.info("Subtree cache: %s", evaluator.stats())
+    if dedup is not None:
+        logger.info("Semantic dedup: %s", dedup.stats())
+    logger.info("LLM usage: %d calls, latency %s, %d tokens, useful offspring per 1k tokens: %s",
+                llm_usage_summary["calls"], llm_usage_summary["latency"],
+                llm_usage_summary["prompt_tokens"] + llm_usage_summary["completion_tokens"],
+                llm_usage_summary["useful_offspring_per_1k_tokens"])
+
+    # **最优个体的 hold-out 适应度：按需计算，并写入共享的测试适应度缓存**
+    if len(hof) > 0:
+        test_cache = open_fitness_cache(fitness_store, file_paths["test_fitness_cache"], X_test, y_test)
+        holdout_fitness = HoldoutFitness(pset, X_test, y_test, test_cache, compile_func)
+        logger.info("Best Individual hold-out fitness: %s", holdout_fitness(hof[0]))
+        save_fitness_cache(file_paths["test_fitness_cache"], holdout_fitness.cache)
+    if fitness_store is not None:
+        fitness_store.close()
 
     return hof[0] if len(hof) > 0 else None
 
-def compute_test_fitness(file_paths, toolbox, pset):
+def compute_test_fitness(file_paths, toolbox, pset, fitness_store_path=None):
     start_time = time.time()
     X_train, y_train, X_test, y_test = load_data(file_paths)
 
-    # **Step 0: 加载测试适应度缓存**
-    cache_test_fitness = read_json(file_paths["test_fitness_cache"])
-
-    updated_data = []
-    jsonl_data = []
-    with open(file_paths["results"], "r") as f:
-        for line in f:
-            entry = json.loads(line)
-            expression = entry["expression"]
-
-            if expression in cache_test_fitness:
-                test_fitness = cache_test_fitness[expression]
-            else:
-                try:
-                    tree = gp.PrimitiveTree.from_string(expression, pset)
-                    _, test_fitness = toolbox.evaluate(tree, pset, X_train, y_train, X_test, y_test)
-                except Exception as e:
-                    print(f"❌ Error processing expression {expression}: {e}")
-                    test_fitness = float("inf")  # 处理异常情况
-
-                cache_test_fitness[expression] = test_fitness
-
-            entry["test_fitness"] = test_fitness
-            updated_data.append(entry)
-            jsonl_data.append(entry)
+    # **Step 0: 加载测试适应度缓存（hold-out 适应度只在这里惰性计算）**
+    fitness_store = FitnessStore(fitness_store_path) if fitness_store_path else None
+    test_cache = open_fitness_cache(fitness_store, file_paths["test_fitness_cache"], X_test, y_test)
+    holdout_fitness = HoldoutFitness(pset, X_test, y_test, test_cache, toolbox.compile,
+                                     getattr(toolbox, "evaluate_population", None))  # 不重复的表达式整批求值
 
-    # **Step 4: 重新写回 JSONL 文件**
-    write_jsonl(file_paths["results"], jsonl_data)
+    # **Step 1-4: 流式处理结果文件，不重复的表达式只计算一次**
+    n_rows, n_unique = annotate_test_fitness(file_paths["results"], holdout_fitness)
+    npz_path = columnar_results_path(file_paths["results"])
+    if os.path.exists(npz_path):
+        annotate_columnar_test_fitness(npz_path, holdout_fitness)  # 同步更新列式结果中的 test_fitness 列
 
     # **Step 5: 保存测试适应度缓存**
-    write_json(file_paths["test_fitness_cache"], cache_test_fitness)
+    save_fitness_cache(file_paths["test_fitness_cache"], holdout_fitness.cache)
+    if fitness_store is not None:
+        fitness_store.close()
 
-    print(f"Test fitness computed in {time.time() - start_time:.2f} seconds")
\ No newline at end of file
+    logger.info("Test fitness computed in %.2f seconds (%d rows, %d unique expressions)",
+                time.time() - start_time, n_rows, n_unique)
\ No newline at end of file
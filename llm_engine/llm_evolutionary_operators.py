@@ -1,5 +1,8 @@
+import ast
+import functools
 import json
 import logging
+import operator
 import random
 import re
 import time
@@ -8,7 +11,12 @@ from typing import List, Any
 import numpy as np
 import sympy
 
-from utils.openai_interface import OpenAIInterface
+from gp_engine.gp_operators import protect_div, protect_sqrt, square
+from utils.llm_interface import LLMInterface
+from utils.llm_usage import get_llm_usage_tracker
+from utils.profiler import get_profiler
+
+logger = logging.getLogger(__name__)
 
 # Part1: 定义全局变量 constraints、init_prompt、crossover_prompt、mutation_prompt
 constraints = ["+", "*", "-", "/", "sqrt", "square", "cos", "sin"]
@@ -58,6 +66,34 @@ Use the listed symbols {constraints}.
 Provide no additional text in response. Format output in JSON as {{"new_expression": "<new expression>"}}
 """
 
+# 批量模式：一次请求携带多个相互独立的交叉/变异任务，公共说明只发送一次
+BATCH_CROSSOVER_PROMPT = """
+You are given {n_tasks} independent pairs of mathematical expressions, one JSON object per line:
+{tasks}
+
+For each pair, recombine the two expressions by performing a single-point crossover, similar to the crossover operation in genetic programming.
+
+Steps:
+1. Randomly select one point in each expression.
+2. Swap the segments before the selected points in each expression.
+3. Combine the first part of the first expression with the second part of the second expression, and vice versa, to create two new expressions.
+
+Please ensure the syntax of the expressions is valid and that the recombined expressions use only the existing terms and operators from the original expressions. Treat every pair independently.
+
+Provide no additional text in response. Format your output in JSON as:{{"results": [{{"id": <id>, "expressions": ["<expression>", "<expression>"]}}]}} with exactly one entry per id.
+"""
+
+BATCH_MUTATION_PROMPT = """
+The goal is to evolve each of the following {n_tasks} mathematical expressions independently and create, for each one, a new expression that differs in structure from the original but still follows mathematical principles.
+
+Given the expressions, one JSON object per line:
+{tasks}
+
+Use the listed symbols {constraints}.
+
+Provide no additional text in response. Format output in JSON as {{"results": [{{"id": <id>, "new_expression": "<new expression>"}}]}} with exactly one entry per id.
+"""
+
 # Part2: 用于检验LLM生成的表达式是否有效的相关函数
 class ProtectedSqrt(sympy.Function):
     # 自定义的平方根函数
@@ -98,7 +134,8 @@ def convert_square_to_root(expression):
             i += 1
     return result
 
-def is_valid_expression(expression):
+def _is_valid_expression_sympy(expression):
+    """ 严格模式：用 SymPy 解析并代入数值检查（较慢，仅在 strict 时使用） """
     try:
         # 1. 替换 square(x) -> root(x, 1/2)
         expression = convert_square_to_root(expression)
@@ -119,14 +156,100 @@ def is_valid_expression(expression):
         return result.is_real
 
     except sympy.SympifyError as e:
-        logging.error(f"SympifyError: {e} for expression {expression}")
+        logger.error("SympifyError: %s for expression %s", e, expression)
     except TypeError as e:
-        logging.error(f"TypeError: {e} for expression {expression}")
+        logger.error("TypeError: %s for expression %s", e, expression)
     except Exception as e:
-        logging.error(f"Unexpected Error: {e} for expression {expression}")
+        logger.error("Unexpected Error: %s for expression %s", e, expression)
 
     return False  # 如果出现错误，返回 False
 
+# 快速校验：把 ast 直接编译为 pset 原语，在一小批探针点上向量化求值
+STRICT_VALIDATION = False  # True 时在快速校验通过后再走一遍 SymPy 严格校验
+
+_BINARY_PRIMITIVES = {
+    ast.Add: ("add", operator.add),
+    ast.Sub: ("sub", operator.sub),
+    ast.Mult: ("mul", operator.mul),
+    ast.Div: ("protect_div", protect_div),
+}
+_UNARY_PRIMITIVES = {
+    "sqrt": ("protect_sqrt", protect_sqrt),
+    "square": ("square", square),
+    "sin": ("sin", np.sin),
+    "cos": ("cos", np.cos),
+}
+# 第一个探针点即原 SymPy 校验使用的 (1.1, 1.2)
+_PROBE_POINTS = {
+    "x1": np.array([1.1, -2.5, -0.3, 0.0, 0.7, 2.0, 3.0, -1.0]),
+    "x2": np.array([1.2, 0.5, -1.7, 2.2, 0.0, -0.4, 1.0, 3.0]),
+}
+
+
+def _compile_probe(node):
+    """ 返回 (可供 PrimitiveTree.from_string 解析的前缀表达式, 探针点上的取值)，不支持的语法抛出 ValueError """
+    if isinstance(node, ast.BinOp):
+        # x ** 2 等价于 square(x)，其余幂运算不在 pset 中
+        if isinstance(node.op, ast.Pow) and isinstance(node.right, ast.Constant) and node.right.value == 2:
+            tree, value = _compile_probe(node.left)
+            return f"square({tree})", square(value)
+        if type(node.op) not in _BINARY_PRIMITIVES:
+            raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
+        name, func = _BINARY_PRIMITIVES[type(node.op)]
+        left_tree, left_value = _compile_probe(node.left)
+        right_tree, right_value = _compile_probe(node.right)
+        return f"{name}({left_tree}, {right_tree})", func(left_value, right_value)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        tree, value = _compile_probe(node.operand)
+        return f"neg({tree})", operator.neg(value)
+
+    if isinstance(node, ast.Call):
+        func_id = node.func.id if isinstance(node.func, ast.Name) else None
+        if func_id not in _UNARY_PRIMITIVES or len(node.args) != 1 or node.keywords:
+            raise ValueError(f"Unsupported function call: {ast.dump(node.func)}")
+        name, func = _UNARY_PRIMITIVES[func_id]
+        tree, value = _compile_probe(node.args[0])
+        return f"{name}({tree})", func(value)
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return str(node.value), node.value
+
+    if isinstance(node, ast.Name) and node.id in _PROBE_POINTS:
+        return node.id, _PROBE_POINTS[node.id]
+
+    raise ValueError(f"Unsupported AST node: {ast.dump(node)}")
+
+
+@functools.lru_cache(maxsize=8192)
+def _validate_expression_cached(expression, strict):
+    try:
+        tree, value = _compile_probe(ast.parse(expression.strip(), mode="eval").body)
+        with np.errstate(all="ignore"):
+            valid = bool(np.all(np.isfinite(np.asarray(value, dtype=float))))
+    except (SyntaxError, ValueError, TypeError, RecursionError) as e:
+        logger.debug("Invalid expression %s: %s", expression, e)
+        return False, None
+
+    if valid and strict:
+        valid = bool(_is_valid_expression_sympy(expression))
+    return valid, tree if valid else None
+
+
+def validate_expression(expression, strict=None):
+    """
+    一次完成校验与转换：返回 (是否有效, pset 前缀表达式字符串)。
+    同一字符串在变异检查、交叉子代检查中会被重复校验，结果按字符串缓存。
+    """
+    if not isinstance(expression, str):
+        return False, None
+    with get_profiler().timer("validation"):
+        return _validate_expression_cached(expression, STRICT_VALIDATION if strict is None else strict)
+
+
+def is_valid_expression(expression, strict=None):
+    return validate_expression(expression, strict)[0]
+
 def check_response_individual_generation(response: str) -> str:
     # 解析LLM生成的JSON响应，提取表达式
     match = re.search(r'\{.*\}', response, re.DOTALL)
@@ -135,7 +258,10 @@ def check_response_individual_generation(response: str) -> str:
     json_text = match.group(0)
     try:
         expression = json.loads(json_text).get('expression', None)
+        if expression is not None:
+            get_llm_usage_tracker().update_last(parsed=1)
         if expression is not None and is_valid_expression(expression):
+            get_llm_usage_tracker().update_last(valid=1, within_height=1)  # 初始化不做树高检查
             return expression
         else:
             return "0"
@@ -159,15 +285,19 @@ def check_response_crossover(response: str, parents: List[str]) -> List[str]:
         expressions = re.findall(r'\{([^\}]+)\}', expressions_string)  # 提取 `{}` 内的表达式
         if expressions:
             cleaned_exprs = [expr.strip().replace('"', '') for expr in expressions]
+            if len(cleaned_exprs) == 2:
+                get_llm_usage_tracker().update_last(parsed=2)
             return cleaned_exprs if len(cleaned_exprs) == 2 else parents
 
         final_exprs = [expr.strip().replace('"', '').replace("{", "").replace("}", "")
                        for expr in re.split(r'\s*,\s*', expressions_string)]
 
+        if len(final_exprs) == 2:
+            get_llm_usage_tracker().update_last(parsed=2)
         return final_exprs if len(final_exprs) == 2 else parents  # **确保返回两个表达式**
 
     except (ValueError, json.JSONDecodeError) as e:
-        logging.error(f"解析 LLM 交叉变异响应失败: {e}")
+        logger.warning("解析 LLM 交叉变异响应失败: %s", e)
         return parents  # **解析失败时，返回 `parents` 作为默认值**
 
 
@@ -179,16 +309,83 @@ def check_mutation_response(response: str, expression: str,) -> str:
 
         match = re.search(r'\"new_expression\"\s*:\s*\"(.*?)\"', cleaned_content, re.DOTALL)
         new_expression = match.group(1).strip().replace('"', '') if match else None
+        if new_expression:
+            get_llm_usage_tracker().update_last(parsed=1)
 
         if new_expression and is_valid_expression(new_expression):
+            get_llm_usage_tracker().update_last(valid=1, within_height=1)
             return new_expression  # 返回 LLM 生成的有效表达式
         else:
             return expression  # 如果无效，回退到原始表达式
 
     except (ValueError, json.JSONDecodeError) as e:
-        logging.error(f"解析 LLM 变异响应时出错: {e}")
+        logger.warning("解析 LLM 变异响应时出错: %s", e)
         return expression  # 解析失败，回退到原始表达式
 
+def parse_batch_response(response: str, n_tasks: int) -> dict:
+    """
+    解析批量请求的响应，返回 {id: 结果对象}。
+    优先按条目中的 "id" 对应到任务槽位；没有 id 时按数组位置对应；无法解析时返回空字典。
+    """
+    cleaned = re.sub(r'```json\n|```', '', response)
+    match = re.search(r'[\{\[].*[\}\]]', cleaned, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        logger.warning("解析 LLM 批量响应失败: %s", e)
+        return {}
+    items = data.get("results", []) if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return {}
+
+    slots = {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        task_id = item.get("id", position)
+        if isinstance(task_id, str) and task_id.strip().isdigit():
+            task_id = int(task_id)
+        if isinstance(task_id, int) and 0 <= task_id < n_tasks and task_id not in slots:
+            slots[task_id] = item
+    return slots
+
+
+def check_batch_crossover_response(response: str, parent_pairs: List[List[str]]) -> List[List[str]]:
+    """ 按槽位提取每对父代的两个子代；某个槽位缺失或无效时，该槽位回退为父代 """
+    slots = parse_batch_response(response, len(parent_pairs))
+    children = []
+    n_parsed = n_valid = 0
+    for task_id, parents in enumerate(parent_pairs):
+        expressions = slots.get(task_id, {}).get("expressions")
+        parsed = isinstance(expressions, list) and len(expressions) == 2
+        n_parsed += 2 * parsed
+        if parsed and all(is_valid_expression(e) for e in expressions):
+            children.append([e.strip() for e in expressions])
+            n_valid += 2
+        else:
+            children.append(list(parents))
+    get_llm_usage_tracker().update_last(parsed=n_parsed, valid=n_valid, within_height=n_valid)
+    return children
+
+
+def check_batch_mutation_response(response: str, expressions: List[str]) -> List[str]:
+    """ 按槽位提取每个表达式的变异结果；某个槽位缺失或无效时，该槽位回退为原表达式 """
+    slots = parse_batch_response(response, len(expressions))
+    mutated = []
+    n_parsed = n_valid = 0
+    for task_id, expression in enumerate(expressions):
+        new_expression = slots.get(task_id, {}).get("new_expression")
+        n_parsed += isinstance(new_expression, str)
+        if is_valid_expression(new_expression):
+            mutated.append(new_expression.strip())
+            n_valid += 1
+        else:
+            mutated.append(expression)
+    get_llm_usage_tracker().update_last(parsed=n_parsed, valid=n_valid, within_height=n_valid)
+    return mutated
+
 # Part3: 生成init、 crossover、mutation的提示词
 def form_prompt_generation(init_prompt) -> str:
     global random_num  # 使用全局变量来追踪上一次的随机数
@@ -249,8 +446,25 @@ def form_prompt_rephrase_mutation(
     # print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
     return prompt
 
+def form_batch_crossover_prompt(parent_pairs, batch_crossover_prompt) -> str:
+    tasks = "\n".join(json.dumps({"id": i, "expressions": list(pair)}) for i, pair in enumerate(parent_pairs))
+    return batch_crossover_prompt.format(n_tasks=len(parent_pairs), tasks=tasks)
+
+def form_batch_mutation_prompt(expressions, batch_mutation_prompt) -> str:
+    tasks = "\n".join(json.dumps({"id": i, "expression": expression}) for i, expression in enumerate(expressions))
+    return batch_mutation_prompt.format(n_tasks=len(expressions), tasks=tasks, constraints=constraints)
+
 # Part4: 调用LLM，发送请求、接收响应
-def collect_llm_generate_expressions(llm_interface: OpenAIInterface, generation_history: list, population_size: int) -> list:
+def _query_llm(llm_interface: LLMInterface, prompt: str, temp, call_site: str, slots: int = 1) -> dict:
+    """ 所有 LLM 请求的统一入口，记录调用次数、耗时，以及按调用点的 token 与延迟 """
+    profiler = get_profiler()
+    with profiler.timer("llm_call"):
+        response = llm_interface.predict_text_logged(prompt, temp=temp)
+    profiler.count("llm_calls")
+    get_llm_usage_tracker().record_call(call_site, response, slots)
+    return response
+
+def collect_llm_generate_expressions(llm_interface: LLMInterface, generation_history: list, population_size: int) -> list:
     # 收集LLM生成的表达式，只包括有效的表达式
     expressions = []
     for i in range(population_size):
@@ -258,7 +472,7 @@ def collect_llm_generate_expressions(llm_interface: OpenAIInterface, generation_
         #     [f"Generated Expression {idx + 1}: {expr['expression']}" for idx, expr in enumerate(generation_history)]
         # )
         prompt = form_prompt_generation(INIT_PROMPT)
-        response = llm_interface.predict_text_logged(prompt, temp=1)
+        response = _query_llm(llm_interface, prompt, temp=1, call_site="init")
         #
         expression = check_response_individual_generation(response["content"])
 
@@ -266,13 +480,13 @@ def collect_llm_generate_expressions(llm_interface: OpenAIInterface, generation_
         generation_history.append({"expression": expression})
         expressions.append(expression)
 
-        print(f"LLM 生成的最终表达式: {expression}")
+        logger.debug("LLM 生成的最终表达式: %s", expression)
 
     return expressions
 
 
 def llm_crossover_expressions(
-    llm_interface: OpenAIInterface,
+    llm_interface: LLMInterface,
     parents: List[str],
 ) -> List[str]:
 
@@ -280,32 +494,62 @@ def llm_crossover_expressions(
     # **Step 2: 生成交叉提示语**
     prompt = form_llm_crossover_expressions([_ for _ in parents],CROSSOVER_PROMPT)
     # **Step 3: 调用 LLM 进行交叉**
-    response = llm_interface.predict_text_logged(prompt, temp=1.0)
+    response = _query_llm(llm_interface, prompt, temp=1.0, call_site="crossover", slots=2)
     new_expressions = check_response_crossover(response["content"], parents)
 
-    if len(new_expressions) == 2 and all(is_valid_expression(expr) for expr in new_expressions):
+    # **解析失败时 check_response_crossover 原样返回 parents，回退的父代不计入 valid / within_height**
+    parsed = new_expressions is not parents
+    if parsed and len(new_expressions) == 2 and all(is_valid_expression(expr) for expr in new_expressions):
         children = new_expressions
+        get_llm_usage_tracker().update_last(valid=2, within_height=2)
     else:
-        print(is_valid_expression(new_expressions[0]),new_expressions[0])
-        print("LLM 生成的表达式无效或数量不足，保持原父代表达式")
+        logger.debug("LLM 生成的表达式无效或数量不足，保持原父代表达式: %s", new_expressions)
 
-    print(f"LLM 交叉后的表达式: {children}")
+    logger.debug("LLM 交叉后的表达式: %s", children)
     return children
 
 def llm_mutated_expressions(
-        llm_interface: OpenAIInterface,
+        llm_interface: LLMInterface,
         expression: str,
 ) -> str:
 
     prompt = form_prompt_rephrase_mutation(expression, MUTATION_PROMPT)
-    response = llm_interface.predict_text_logged(prompt, temp=1)
+    response = _query_llm(llm_interface, prompt, temp=1, call_site="mutation")
 
     new_expression = check_mutation_response(response["content"], expression)
 
     # **检查变异表达式的有效性**
     if new_expression and is_valid_expression(new_expression):
-        print(f"LLM生成的变异表达式：{new_expression}")
+        logger.debug("LLM生成的变异表达式：%s", new_expression)
         return new_expression  # 更新子代表达式
     else:
-        print(f"LLM 生成的变异表达式无效，保持原表达式: {expression}")
+        logger.debug("LLM 生成的变异表达式无效，保持原表达式: %s", expression)
         return expression
+
+
+def llm_batch_crossover_expressions(
+    llm_interface: LLMInterface,
+    parent_pairs: List[List[str]],
+) -> List[List[str]]:
+    """ 一次请求完成多对父代的交叉，返回与 parent_pairs 等长的子代列表 """
+    prompt = form_batch_crossover_prompt(parent_pairs, BATCH_CROSSOVER_PROMPT)
+    response = _query_llm(llm_interface, prompt, temp=1.0, call_site="crossover", slots=2 * len(parent_pairs))
+    children = check_batch_crossover_response(response["content"], parent_pairs)
+
+    n_fallback = sum(child == list(parents) for child, parents in zip(children, parent_pairs))
+    logger.debug("LLM 批量交叉: %d 对，其中 %d 对保持原父代表达式", len(parent_pairs), n_fallback)
+    return children
+
+
+def llm_batch_mutated_expressions(
+        llm_interface: LLMInterface,
+        expressions: List[str],
+) -> List[str]:
+    """ 一次请求完成多个表达式的变异，返回与 expressions 等长的变异结果 """
+    prompt = form_batch_mutation_prompt(expressions, BATCH_MUTATION_PROMPT)
+    response = _query_llm(llm_interface, prompt, temp=1, call_site="mutation", slots=len(expressions))
+    mutated = check_batch_mutation_response(response["content"], expressions)
+
+    n_fallback = sum(new == old for new, old in zip(mutated, expressions))
+    logger.debug("LLM 批量变异: %d 个，其中 %d 个保持原表达式", len(expressions), n_fallback)
+    return mutated
@@ -1,4 +1,5 @@
 import json
+import logging
 import operator
 import random
 import numpy as np
@@ -9,18 +10,25 @@ import deap.tools as tools
 
 
 from gp_engine.gp_operators import protect_div, protect_sqrt, square
-from llm_engine.llm_evolutionary_operators import llm_crossover_expressions, llm_mutated_expressions
+from gp_engine.stack_interpreter import PopulationInterpreter
+from llm_engine.llm_evolutionary_operators import llm_crossover_expressions, llm_mutated_expressions, \
+    llm_batch_crossover_expressions, llm_batch_mutated_expressions, validate_expression
+from utils.compile_cache import CompiledExpressionCache
 from utils.convert_tree2expression import expression_to_tree, tree_to_expression
-from utils.evaluation import evalSymbReg
+from utils.evaluation import evalTrainFitness
+from utils.llm_usage import get_llm_usage_tracker
+from utils.subtree_cache import SubtreeMemoEvaluator
 from utils.readAndwrite import read_jsonl, read_json
 
+logger = logging.getLogger(__name__)
+
 
 def parse_llm_expressions(jsonl_file, pset):
     parsed_trees = []
     expressions = read_jsonl(jsonl_file)  # 读取 JSONL 文件
 
     if not expressions:
-        print(f"⚠️ Warning: No expressions found in {jsonl_file}")
+        logger.warning("⚠️ Warning: No expressions found in %s", jsonl_file)
         return parsed_trees
 
     for entry in expressions:
@@ -30,9 +38,9 @@ def parse_llm_expressions(jsonl_file, pset):
             tree = gp.PrimitiveTree.from_string(parsed_expr, pset)
             parsed_trees.append(tree)
         except Exception as e:
-            print(f"❌ Error parsing expression {expr}: {e}")
+            logger.error("❌ Error parsing expression %s: %s", expr, e)
 
-    print(f"✅ Loaded {len(parsed_trees)} expressions from {jsonl_file}.")
+    logger.info("✅ Loaded %d expressions from %s.", len(parsed_trees), jsonl_file)
     return parsed_trees
 
 def parse_gp_expressions(jsonl_file):
@@ -40,7 +48,7 @@ def parse_gp_expressions(jsonl_file):
     expressions = read_jsonl(jsonl_file)  # 读取 JSONL 文件
 
     if not expressions:
-        print(f"⚠️ Warning: No expressions found in {jsonl_file}")
+        logger.warning("⚠️ Warning: No expressions found in %s", jsonl_file)
         return parsed_trees
 
     for entry in expressions:
@@ -48,9 +56,9 @@ def parse_gp_expressions(jsonl_file):
         try:
             parsed_trees.append(expr)
         except Exception as e:
-            print(f"❌ Error parsing expression {expr}: {e}")
+            logger.error("❌ Error parsing expression %s: %s", expr, e)
 
-    print(f"✅ Loaded {len(parsed_trees)} expressions from {jsonl_file}.")
+    logger.info("✅ Loaded %d expressions from %s.", len(parsed_trees), jsonl_file)
     return parsed_trees
 
 def load_all_expressions(jsonl_file, pset=None):
@@ -69,7 +77,7 @@ def load_all_expressions(jsonl_file, pset=None):
     parsed_expressions = [expression_to_tree(expr) for expr in expressions]
     parsed_trees = [gp.PrimitiveTree.from_string(expr, pset) for expr in parsed_expressions]
 
-    print(f"Loaded {len(parsed_trees)} expressions into parsed_trees.")
+    logger.info("Loaded %d expressions into parsed_trees.", len(parsed_trees))
     return parsed_trees
 
 # def initIndividual(parsed_trees):
@@ -95,68 +103,104 @@ def cxOnePointListOfTrees(ind1, ind2, parsed_trees, llm_interface=None, pset=Non
     ind1_tree = gp.PrimitiveTree(ind1) if isinstance(ind1, creator.Individual) else ind1
     ind2_tree = gp.PrimitiveTree(ind2) if isinstance(ind2, creator.Individual) else ind2
 
-    print(f"Before Crossover: ind1 Tree: {ind1_tree}, ind2 Tree: {ind2_tree}")
+    logger.debug("Before Crossover: ind1 Tree: %s, ind2 Tree: %s", ind1_tree, ind2_tree)
 
     # **转换为数学表达式**
     expr1 = tree_to_expression(ind1_tree)
     expr2 = tree_to_expression(ind2_tree)
-    print(f"Converted Expressions: expr1: {expr1}, expr2: {expr2}")
+    logger.debug("Converted Expressions: expr1: %s, expr2: %s", expr1, expr2)
 
     # **调用 LLM 交叉**
     new_expressions = llm_crossover_expressions(llm_interface, [expr1, expr2])
 
     # **转换回 GP 结构**
     try:
-        new_tree1 = gp.PrimitiveTree.from_string(expression_to_tree(new_expressions[0]), pset)
-        new_tree2 = gp.PrimitiveTree.from_string(expression_to_tree(new_expressions[1]), pset)
+        new_tree1 = gp.PrimitiveTree.from_string(validate_expression(new_expressions[0])[1], pset)
+        new_tree2 = gp.PrimitiveTree.from_string(validate_expression(new_expressions[1])[1], pset)
     except Exception as e:
-        print(f"交叉因为异常返回父代")
+        logger.debug("交叉因为异常返回父代: %s", e)
+        get_llm_usage_tracker().update_last(within_height=0)
         return ind1, ind2
-    print(f"New Trees: new_tree1.height: {new_tree1.height}, new_tree2.height: {new_tree2.height}")
+    logger.debug("New Trees: new_tree1.height: %d, new_tree2.height: %d", new_tree1.height, new_tree2.height)
 
     # **手动检查树高**
     if new_tree1.height > HEIGHT_LIMIT:
-        print(f"⚠️ new_tree1 超出高度限制 ({new_tree1.height} > {HEIGHT_LIMIT})，使用父代 ind1 替换")
+        logger.debug("⚠️ new_tree1 超出高度限制 (%d > %d)，使用父代 ind1 替换", new_tree1.height, HEIGHT_LIMIT)
         new_tree1 = ind1_tree
+        get_llm_usage_tracker().discount_last(1)
 
     if new_tree2.height > HEIGHT_LIMIT:
-        print(f"⚠️ new_tree2 超出高度限制 ({new_tree2.height} > {HEIGHT_LIMIT})，使用父代 ind2 替换")
+        logger.debug("⚠️ new_tree2 超出高度限制 (%d > %d)，使用父代 ind2 替换", new_tree2.height, HEIGHT_LIMIT)
         new_tree2 = ind2_tree
+        get_llm_usage_tracker().discount_last(1)
     new_individual1 = creator.Individual(new_tree1)
     new_individual2 = creator.Individual(new_tree2)
 
-    print(f"After Crossover: new_individual1: {new_individual1}, new_individual2: {new_individual2}")
+    logger.debug("After Crossover: new_individual1: %s, new_individual2: %s", new_individual1, new_individual2)
 
     return new_individual1, new_individual2
 
 def mutUniformListOfTrees(ind, pset, parsed_trees=None, llm_interface=None):
     HEIGHT_LIMIT = 6
     ind_tree = gp.PrimitiveTree(ind) if isinstance(ind, creator.Individual) else ind
-    print(f"Before Mutation: ind Tree: {ind_tree}")
+    logger.debug("Before Mutation: ind Tree: %s", ind_tree)
     try:
         expr1 = tree_to_expression(ind_tree)
         new_expression = llm_mutated_expressions(llm_interface, expr1)
-        new_expression = new_expression.replace("**", "square")
-        new_tree1 = gp.PrimitiveTree.from_string(expression_to_tree(new_expression), pset)
+        new_tree1 = gp.PrimitiveTree.from_string(validate_expression(new_expression)[1], pset)
 
     except Exception as e:
-        print(f"变异因为异常，返回父代")
+        logger.debug("变异因为异常，返回父代: %s", e)
+        get_llm_usage_tracker().update_last(within_height=0)
         return (ind,)
 
-    print(f"New Mutated Tree Height: {new_tree1.height}")
+    logger.debug("New Mutated Tree Height: %d", new_tree1.height)
 
     # **手动检查树高**
     if new_tree1.height > HEIGHT_LIMIT:
-        print(f"⚠️ new_tree1 超出高度限制 ({new_tree1.height} > {HEIGHT_LIMIT})，使用父代 ind 替换")
+        logger.debug("⚠️ new_tree1 超出高度限制 (%d > %d)，使用父代 ind 替换", new_tree1.height, HEIGHT_LIMIT)
+        get_llm_usage_tracker().discount_last(1)
         return ind,
 
     # **转换回 Individual**
     new_individual = creator.Individual(new_tree1)
 
-    print(f"After Mutation: new_individual: {new_individual}")
+    logger.debug("After Mutation: new_individual: %s", new_individual)
     return new_individual,
 
 
+def _child_individual(expression, parent, pset, HEIGHT_LIMIT=6):
+    """ 把 LLM 返回的表达式转换回个体；无法解析或超出树高时用父代替换 """
+    try:
+        tree = gp.PrimitiveTree.from_string(validate_expression(expression)[1], pset)
+    except Exception:
+        return parent
+    if tree.height > HEIGHT_LIMIT:
+        logger.debug("⚠️ 子代超出高度限制 (%d > %d)，使用父代替换", tree.height, HEIGHT_LIMIT)
+        return parent
+    return creator.Individual(tree)
+
+def cxBatchListOfTrees(pairs, parsed_trees=None, llm_interface=None, pset=None):
+    """ 批量交叉：pairs 为 [(ind1, ind2), ...]，一次 LLM 请求完成，逐槽位回退到父代 """
+    assert pset is not None, "❌ `pset` 不能为 None！"
+    parent_pairs = [[tree_to_expression(gp.PrimitiveTree(ind1)), tree_to_expression(gp.PrimitiveTree(ind2))]
+                    for ind1, ind2 in pairs]
+    children = llm_batch_crossover_expressions(llm_interface, parent_pairs)
+    offspring = [(_child_individual(expr1, ind1, pset), _child_individual(expr2, ind2, pset))
+                 for (ind1, ind2), (expr1, expr2) in zip(pairs, children)]
+    get_llm_usage_tracker().discount_last(sum(child is parent for pair, children_pair in zip(pairs, offspring)
+                                              for parent, child in zip(pair, children_pair)))
+    return offspring
+
+def mutBatchListOfTrees(inds, pset, llm_interface=None):
+    """ 批量变异：一次 LLM 请求完成，返回与 mutate 相同的 [(ind,), ...] 形式 """
+    expressions = [tree_to_expression(gp.PrimitiveTree(ind)) for ind in inds]
+    mutated = llm_batch_mutated_expressions(llm_interface, expressions)
+    offspring = [(_child_individual(expression, ind, pset),) for ind, expression in zip(inds, mutated)]
+    get_llm_usage_tracker().discount_last(sum(child is ind for ind, (child,) in zip(inds, offspring)))
+    return offspring
+
+
 def create_pset():
     # 定义GP语法树
     pset = gp.PrimitiveSet("MAIN", 2)
@@ -175,7 +219,8 @@ def create_pset():
     pset.addTerminal(1)
     return pset
 
-def create_llm_toolbox(init_method="gp", parsed_trees=None, pset=None):
+def create_llm_toolbox(init_method="gp", parsed_trees=None, pset=None, compile_cache_size=4096,
+                       evaluator="compiled", subtree_cache_bytes=256 * 1024 * 1024):
     if pset is None:
         raise ValueError("❌ `pset` 不能为空！请先调用 `create_pset()` 生成 `pset`")
 
@@ -198,10 +243,20 @@ def create_llm_toolbox(init_method="gp", parsed_trees=None, pset=None):
         toolbox.register("individual", lambda: next(individual_iter))
 
     toolbox.register("population", tools.initRepeat, list, toolbox.individual)
-    toolbox.register('compile', gp.compile, pset=pset)
-    toolbox.register("evaluate", evalSymbReg)
+    toolbox.register('compile', CompiledExpressionCache(pset, maxsize=compile_cache_size))  # 带 LRU 缓存的 gp.compile
+    if evaluator == "compiled":
+        toolbox.register("evaluate", evalTrainFitness)
+    elif evaluator == "subtree":
+        # 子树级语义缓存：每个不同子树在每个数据集上只计算一次
+        toolbox.register("evaluate", SubtreeMemoEvaluator(pset, max_bytes=subtree_cache_bytes))
+    else:
+        raise ValueError(f"❌ 未知的 evaluator: {evaluator}（可选 compiled / subtree）")
+    # **整代批量求值：compute_test_fitness 中不重复的 hold-out 表达式一次性求值**
+    toolbox.register("evaluate_population", PopulationInterpreter(pset))
     toolbox.register("select", tools.selTournament, tournsize=3)
     toolbox.register("mate", cxOnePointListOfTrees)
     toolbox.register("mutate", mutUniformListOfTrees, pset=pset)
+    toolbox.register("mate_batch", cxBatchListOfTrees)
+    toolbox.register("mutate_batch", mutBatchListOfTrees, pset=pset)
 
     return toolbox
\ No newline at end of file
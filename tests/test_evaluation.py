@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+import pytest
+from deap import gp
+
+from gp_engine.gp_operators import create_pset
+from utils.data_loader import load_data
+from utils.evaluation import evalSymbReg, evalTrainFitness
+
+# **向量化求值与逐行求值的运算顺序不同，个别表达式会差几个 ULP，按相对误差比较**
+RTOL = 1e-9
+
+FILE_PATHS = {"train_data": "datasets/fitness_cases4.csv", "test_data": "datasets/hold_out4.csv"}
+
+
+@pytest.fixture(scope="module")
+def data():
+    return load_data(FILE_PATHS, use_cache=False)
+
+
+def _trees(pset, n=200, seed=0):
+    random.seed(seed)
+    fixed = ["protect_div(x1, sub(x2, x2))", "protect_sqrt(neg(x1))", "square(1)", "mul(x1, x2)"]
+    trees = [gp.PrimitiveTree.from_string(expression, pset) for expression in fixed]
+    trees += [gp.PrimitiveTree(gp.genHalfAndHalf(pset, 1, 5)) for _ in range(n)]
+    return trees
+
+
+def test_vectorized_fitness_matches_per_row(data):
+    X_train, y_train, X_test, y_test = data
+    pset = create_pset()
+    for tree in _trees(pset):
+        per_row_train, per_row_test = evalSymbReg(tree, pset, X_train, y_train, X_test, y_test)
+        assert np.isclose(evalTrainFitness(tree, pset, X_train, y_train), per_row_train,
+                          rtol=RTOL, atol=0.0, equal_nan=True), str(tree)
+        assert np.isclose(evalTrainFitness(tree, pset, X_test, y_test), per_row_test,
+                          rtol=RTOL, atol=0.0, equal_nan=True), str(tree)
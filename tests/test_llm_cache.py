@@ -0,0 +1,17 @@
+from utils.llm_cache import LLMResponseCache
+
+
+def test_running_byte_total_matches_table(tmp_path):
+    db_path = str(tmp_path / "llm_cache.db")
+    cache = LLMResponseCache(db_path, max_bytes=20_000)
+    for i in range(600):
+        prompt = f"prompt {i % 500}"  # 最后 100 次覆盖已有的键
+        cache.put(cache.make_key("m", 1.0, prompt, 0), "m", 1.0, prompt, 0, {"content": "x" * (20 + i % 37)})
+        assert cache._nbytes == cache._total_bytes()
+    assert cache.evictions > 0
+    assert cache.stats()["nbytes"] <= 20_000
+    cache.close()
+
+    reopened = LLMResponseCache(db_path, max_bytes=20_000)
+    assert reopened._nbytes == reopened._total_bytes()
+    reopened.close()
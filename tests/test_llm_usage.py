@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from llm_engine.llm_evolutionary_operators import llm_crossover_expressions
+from utils.llm_interface import LLMInterface
+from utils.llm_usage import LLMUsageTracker, set_llm_usage_tracker
+
+
+class CannedLLMInterface(LLMInterface):
+    """ 每次请求都返回同一段固定内容 """
+
+    model = "canned"
+
+    def __init__(self, content):
+        self.content = content
+
+    def predict_text_logged(self, prompt, temp=1):
+        return {"prompt": prompt, "content": self.content, "n_prompt_tokens": 10,
+                "n_completion_tokens": 5, "response_time": 0.0}
+
+
+@pytest.fixture
+def tracker():
+    tracker = LLMUsageTracker()
+    set_llm_usage_tracker(tracker)
+    yield tracker
+    set_llm_usage_tracker(None)
+
+
+def test_crossover_fallback_is_not_credited(tracker):
+    parents = ["x1 + x2", "sin(x1)"]
+    children = llm_crossover_expressions(CannedLLMInterface("sorry, I cannot help with that"), parents)
+
+    assert children == parents
+    record, = tracker.records
+    assert (record["slots"], record["parsed"], record["valid"], record["within_height"]) == (2, 0, 0, 0)
+
+
+def test_crossover_parsed_children_are_credited(tracker):
+    content = json.dumps({"expressions": ["x1 * x2", "cos(x2) + 1"]})
+    children = llm_crossover_expressions(CannedLLMInterface(content), ["x1 + x2", "sin(x1)"])
+
+    assert children == ["x1 * x2", "cos(x2) + 1"]
+    record, = tracker.records
+    assert (record["parsed"], record["valid"], record["within_height"]) == (2, 2, 2)
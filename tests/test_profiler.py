@@ -0,0 +1,24 @@
+import json
+
+from utils.profiler import GenerationProfiler
+
+
+def _generations(path):
+    with open(path) as f:
+        return [json.loads(line)["generation"] for line in f]
+
+
+def test_resume_drops_metrics_after_checkpoint(tmp_path):
+    path = str(tmp_path / "holdout.metrics.jsonl")
+    profiler = GenerationProfiler(path)
+    for gen in range(4):
+        profiler.count("evaluations")
+        profiler.end_generation(gen)
+    profiler.count("results_io")
+    profiler.close()  # 检查点之后的第 3 代与收尾行都已写出
+
+    profiler = GenerationProfiler(path, resume_generation=3)
+    profiler.end_generation(3)
+    profiler.close()
+
+    assert _generations(path) == [0, 1, 2, 3]
@@ -0,0 +1,70 @@
+import logging
+import os
+import pickle
+import random
+
+import numpy as np
+from deap import creator, gp
+
+from utils.readAndwrite import ensure_directory_exists
+
+logger = logging.getLogger(__name__)
+
+
+def save_checkpoint(file_path, state):
+    """ 先写临时文件再原子替换：中途被打断时磁盘上始终保留上一个完整的检查点 """
+    ensure_directory_exists(file_path)
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def load_checkpoint(file_path):
+    """ 读取检查点，不存在时返回 None """
+    if not file_path or not os.path.exists(file_path):
+        return None
+    with open(file_path, "rb") as f:
+        return pickle.load(f)
+
+
+def remove_checkpoint(file_path):
+    """ 运行正常结束后删除检查点，之后的 --resume 从头开始 """
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def rng_state():
+    return {"python": random.getstate(), "numpy": np.random.get_state()}
+
+
+def restore_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+
+
+def individuals_state(individuals):
+    """
+    个体以 (表达式字符串, 适应度) 保存：pset 中的 ephemeral 常数由 lambda 生成，个体本身无法 pickle。
+    适应度已被清除（交叉 / 变异后的子代）时记为 None。
+    """
+    return [(str(ind), ind.fitness.values if ind.fitness.valid else None) for ind in individuals]
+
+
+def restore_individuals(entries, pset):
+    individuals = []
+    for expression, fitness in entries:
+        ind = creator.Individual(gp.PrimitiveTree.from_string(expression, pset))
+        if fitness is not None:
+            ind.fitness.values = fitness
+        individuals.append(ind)
+    return individuals
+
+
+def cache_delta(cache, initial_expressions):
+    """ 本次运行新增的缓存条目；共享存储（FitnessStore）每代已提交，无需保存 """
+    if not isinstance(cache, dict):
+        return {}
+    return {expression: fitness for expression, fitness in cache.items() if expression not in initial_expressions}
@@ -0,0 +1,80 @@
+import json
+import os
+
+import numpy as np
+
+from utils.readAndwrite import ensure_directory_exists
+
+
+def columnar_results_path(results_path):
+    """ 列式结果文件与 JSONL 结果文件同名，扩展名为 .npz """
+    return os.path.splitext(results_path)[0] + ".npz"
+
+
+class ColumnarResultsWriter:
+    """
+    按列收集每代记录，close() 时写成一个 .npz 文件：
+    generation / train_fitness / test_fitness 为数值列，
+    表达式列做字典编码（expressions 为不重复表达式表，expression_code 为每行在表中的下标）。
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._codes = {}
+        self.generation = []
+        self.expression_code = []
+        self.train_fitness = []
+        self.test_fitness = []
+
+    def append(self, records):
+        for record in records:
+            code = self._codes.setdefault(record["expression"], len(self._codes))
+            self.generation.append(record["generation"])
+            self.expression_code.append(code)
+            self.train_fitness.append(record["train_fitness"])
+            self.test_fitness.append(record.get("test_fitness", np.nan))
+
+    def close(self):
+        save_columnar_results(self.file_path, {
+            "generation": np.asarray(self.generation, dtype=np.int32),
+            "expression_code": np.asarray(self.expression_code, dtype=np.int32),
+            "expressions": np.asarray(list(self._codes), dtype=str),
+            "train_fitness": np.asarray(self.train_fitness, dtype=np.float64),
+            "test_fitness": np.asarray(self.test_fitness, dtype=np.float64),
+        })
+
+
+def save_columnar_results(file_path, columns):
+    """ 先写临时文件再原子替换，避免分析脚本读到写了一半的文件 """
+    ensure_directory_exists(file_path)
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **columns)
+    os.replace(tmp_path, file_path)
+
+
+def load_columnar_results(file_path):
+    """ 读取全部列，返回 {列名: ndarray}；行 i 的表达式为 expressions[expression_code[i]] """
+    with np.load(file_path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def jsonl_to_columnar(results_path, npz_path=None):
+    """ 把已有的 holdout_*.jsonl 结果文件转换为列式 .npz，逐行流式读取 """
+    npz_path = npz_path or columnar_results_path(results_path)
+    writer = ColumnarResultsWriter(npz_path)
+    with open(results_path, "r") as f:
+        for line in f:
+            writer.append([json.loads(line)])
+    writer.close()
+    return npz_path
+
+
+def annotate_columnar_test_fitness(npz_path, holdout_fitness):
+    """ 为列式结果补上 test_fitness：每个不重复表达式只计算一次，再按编码整列展开 """
+    columns = load_columnar_results(npz_path)
+    expressions = columns["expressions"].tolist()
+    holdout_fitness.evaluate_many(expressions)
+    test_fitness = np.asarray([holdout_fitness(expression) for expression in expressions], dtype=np.float64)
+    columns["test_fitness"] = test_fitness[columns["expression_code"]]
+    save_columnar_results(npz_path, columns)
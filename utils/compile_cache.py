@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+from deap import gp
+
+
+class CompiledExpressionCache:
+    """
+    gp.compile 结果的 LRU 缓存，按规范表达式字符串 str(individual) 作为键。
+    精英个体和锦标赛复制出的个体每一代都会重复出现，缓存命中后无需再次 eval 源码。
+    """
+
+    def __init__(self, pset, maxsize=4096):
+        if maxsize <= 0:
+            raise ValueError(f"❌ maxsize 必须为正数，当前为 {maxsize}")
+        self.pset = pset
+        self.maxsize = maxsize
+        self._funcs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __call__(self, individual):
+        expression = str(individual)
+        func = self._funcs.get(expression)
+        if func is not None:
+            self._funcs.move_to_end(expression)
+            self.hits += 1
+            return func
+
+        self.misses += 1
+        # gp.compile 内部同样是 str(expr)，直接传字符串可省去 PrimitiveTree.from_string
+        func = gp.compile(expression, self.pset)
+        self._funcs[expression] = func
+        if len(self._funcs) > self.maxsize:
+            self._funcs.popitem(last=False)  # 淘汰最久未使用的表达式
+            self.evictions += 1
+        return func
+
+    def __len__(self):
+        return len(self._funcs)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._funcs),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -42,6 +42,7 @@ def generate_file_paths(function_id, experiment_id, base_path, llm_path):
         "results": f"{base_path}/results/func{{function_id}}/holdout_func{{function_id}}_exp{{experiment_id}}.jsonl",
         "first_generation_cache": f"{base_path}/records/func{{function_id}}/first_generation_func{{function_id}}_exp{{experiment_id}}.jsonl",
         "experiment_time_log": f"{base_path}/timelogs/func{{function_id}}/experiment_time_log_func{{function_id}}.json",
+        "checkpoint": f"{base_path}/checkpoints/func{{function_id}}/checkpoint_func{{function_id}}_exp{{experiment_id}}.pkl",
         "init_expressions": f"../datasets/{llm_path}_expressions.jsonl",
         "train_data": "../datasets/fitness_cases{function_id}.csv",
         "test_data": "../datasets/hold_out{function_id}.csv",
@@ -55,9 +56,9 @@ def generate_file_paths(function_id, experiment_id, base_path, llm_path):
              path_templates.items()}
 
     # **🔹 确保路径存在**
-    for path in paths.values():
+    for key, path in paths.items():
         ensure_directory_exists(path)
-        if not os.path.exists(path):
+        if key != "checkpoint" and not os.path.exists(path):  # 检查点只在运行中写出，存在即表示可续跑
             write_json(path, {} if path.endswith(".json") else [])
 
     # **🔹 调试输出**
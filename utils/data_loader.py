@@ -1,12 +1,8 @@
-import pandas as pd
+from utils.dataset_cache import load_dataset
 
-def load_data(file_paths):
-    # **加载训练数据**
-    df_train = pd.read_csv(file_paths["train_data"])
-    X_train = df_train[["x1", "x2"]].to_numpy()
-    y_train = df_train["y"].to_numpy()
+def load_data(file_paths, use_cache=True):
+    # **加载训练数据（首次转换为 .npy 缓存，之后只读内存映射）**
+    X_train, y_train = load_dataset(file_paths["train_data"], use_cache=use_cache)
 
-    df_test = pd.read_csv(file_paths["test_data"])
-    X_test = df_test[["x1", "x2"]].to_numpy()
-    y_test = df_test["y"].to_numpy()
-    return X_train, y_train, X_test, y_test
\ No newline at end of file
+    X_test, y_test = load_dataset(file_paths["test_data"], use_cache=use_cache)
+    return X_train, y_train, X_test, y_test
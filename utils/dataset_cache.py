@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = ".npy_cache"
+TARGET_COLUMN = "y"
+
+
+def _file_sha256(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_paths(csv_path):
+    """ 缓存放在 CSV 同目录的 .npy_cache/ 下：<stem>.json 为元数据，<stem>.<hash>.npy 为数据 """
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(csv_path)), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return cache_dir, stem, os.path.join(cache_dir, stem + ".json")
+
+
+def _read_csv(csv_path, target=TARGET_COLUMN):
+    """ 特征列为除目标列外的全部列（按 CSV 中的顺序），目标列放在最后一列 """
+    df = pd.read_csv(csv_path)
+    columns = [c for c in df.columns if c != target] + [target]
+    # **按列存储（Fortran 顺序）：X[:, i] 与 y 都是连续内存，向量化求值时无需拷贝**
+    return np.asfortranarray(df[columns].to_numpy(dtype=np.float64)), columns
+
+
+def _atomic_write(file_path, write):
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"  # 并行实验可能同时构建同一份缓存
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, file_path)
+
+
+def _build_cache(csv_path, content_hash, target):
+    cache_dir, stem, meta_path = _cache_paths(csv_path)
+    data, columns = _read_csv(csv_path, target)
+    npy_path = os.path.join(cache_dir, f"{stem}.{content_hash[:16]}.npy")
+    os.makedirs(cache_dir, exist_ok=True)
+    _atomic_write(npy_path, lambda f: np.save(f, data))
+
+    stat = os.stat(csv_path)
+    meta = {"sha256": content_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "columns": columns, "npy": os.path.basename(npy_path)}
+    _atomic_write(meta_path, lambda f: f.write(json.dumps(meta, indent=4).encode()))
+
+    # **CSV 内容变化后旧的数据文件不再被引用，顺手删除**
+    for name in os.listdir(cache_dir):
+        if name.startswith(stem + ".") and name.endswith(".npy") and name != meta["npy"]:
+            os.remove(os.path.join(cache_dir, name))
+    return meta
+
+
+def _cached_meta(csv_path, target):
+    """ 大小与修改时间未变时直接信任元数据；否则重新计算内容哈希，内容变化才重建 """
+    cache_dir, _, meta_path = _cache_paths(csv_path)
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["columns"][-1] != target or not os.path.exists(os.path.join(cache_dir, meta["npy"])):
+            meta = None
+
+    stat = os.stat(csv_path)
+    if meta is not None and (meta["size"], meta["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+        return meta
+
+    content_hash = _file_sha256(csv_path)
+    if meta is not None and meta["sha256"] == content_hash:
+        meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)  # 只是被 touch 过，内容未变
+        _atomic_write(meta_path, lambda f: f.write(json.dumps(meta, indent=4).encode()))
+        return meta
+    return _build_cache(csv_path, content_hash, target)
+
+
+def load_dataset(csv_path, target=TARGET_COLUMN, use_cache=True):
+    """
+    读取数据集，返回 (X, y)。
+    首次读取时把 CSV 转换为 .npy 缓存，之后以只读方式内存映射，X / y 都是映射上的视图，不做拷贝。
+    """
+    if use_cache:
+        try:
+            meta = _cached_meta(csv_path, target)
+            cache_dir, _, _ = _cache_paths(csv_path)
+            data = np.load(os.path.join(cache_dir, meta["npy"]), mmap_mode="r")
+            return data[:, :-1], data[:, -1]
+        except OSError as e:
+            logger.warning("⚠️ 数据集缓存不可用，直接读取 CSV %s: %s", csv_path, e)
+    data, _ = _read_csv(csv_path, target)
+    return data[:, :-1], data[:, -1]
@@ -1,10 +1,123 @@
+import json
+import logging
+import os
+
 import numpy as np
 from deap import gp
 
+logger = logging.getLogger(__name__)
+
 def evalSymbReg(individual, pset, X_train, y_train, X_test, y_test):
     func = gp.compile(individual, pset)
     predictions_train = np.array([func(x1, x2) for x1, x2 in X_train])
     predictions_test = np.array([func(x1, x2) for x1, x2 in X_test])
     train_fitness = np.mean((predictions_train - y_train) ** 2)
     test_fitness = np.mean((predictions_test - y_test) ** 2)
-    return train_fitness, test_fitness
\ No newline at end of file
+    return train_fitness, test_fitness
+
+
+def predict_vectorized(func, X):
+    """ 以整列数组调用一次编译后的表达式，返回与样本数等长的预测向量 """
+    with np.errstate(all="ignore"):
+        predictions = func(*(X[:, i] for i in range(X.shape[1])))
+    # 常数表达式（如 square(1)）只返回标量，需要广播到样本数
+    return np.broadcast_to(np.asarray(predictions, dtype=float), (X.shape[0],))
+
+
+def mean_squared_error(predictions, y):
+    with np.errstate(all="ignore"):
+        return np.mean((predictions - y) ** 2)
+
+
+def evalTrainFitness(individual, pset, X_train, y_train, compile_func=None):
+    """ 只计算训练集适应度：进化过程中的选择只依赖训练集 """
+    func = compile_func(individual) if compile_func is not None else gp.compile(individual, pset)
+    return mean_squared_error(predict_vectorized(func, X_train), y_train)
+
+
+class HoldoutFitness:
+    """
+    惰性计算 hold-out 适应度。
+    只有 compute_test_fitness 或最优个体报告真正需要时才在测试集上评估，
+    结果按表达式字符串存入共享缓存（即 test_fitness_cache 文件中的字典）。
+    传入 evaluate_population（如 toolbox.evaluate_population）且测试样本不超过 batch_max_rows 时，
+    evaluate_many 把未命中的表达式整批求值；样本更多时逐表达式的向量化求值更快（整批解释器的分组与拷贝开销随样本数增长）。
+    """
+
+    def __init__(self, pset, X_test, y_test, cache=None, compile_func=None, evaluate_population=None,
+                 batch_max_rows=512):
+        self.pset = pset
+        self.X_test = X_test
+        self.y_test = y_test
+        self.cache = cache if cache is not None else {}
+        self.compile_func = compile_func
+        self.evaluate_population = evaluate_population
+        self.batch_max_rows = batch_max_rows
+
+    def __call__(self, individual):
+        expression = str(individual)
+        if expression in self.cache:
+            return self.cache[expression]
+
+        try:
+            # gp.compile 直接接受表达式字符串，无需先 PrimitiveTree.from_string
+            if self.compile_func is not None:
+                func = self.compile_func(expression)
+            else:
+                func = gp.compile(expression, self.pset)
+            test_fitness = mean_squared_error(predict_vectorized(func, self.X_test), self.y_test)
+        except Exception as e:
+            logger.error("❌ Error processing expression %s: %s", expression, e)
+            test_fitness = float("inf")  # 处理异常情况
+
+        self.cache[expression] = test_fitness
+        return test_fitness
+
+    def evaluate_many(self, expressions):
+        """
+        批量计算：共享存储先一次性预取，未命中的不重复表达式一次调用 evaluate_population 整批求值；
+        无法解析或整批求值失败的表达式回退到逐个计算（出错记为 inf）。
+        """
+        expressions = [str(expression) for expression in expressions]
+        if hasattr(self.cache, "prefetch"):
+            self.cache.prefetch(expressions)
+        misses = list(dict.fromkeys(expression for expression in expressions if expression not in self.cache))
+        if misses and self.evaluate_population is not None and len(self.y_test) <= self.batch_max_rows:
+            trees = {}
+            for expression in misses:
+                try:
+                    trees[expression] = gp.PrimitiveTree.from_string(expression, self.pset)
+                except Exception:
+                    pass
+            try:
+                fitness = self.evaluate_population(list(trees.values()), self.X_test, self.y_test)
+                for expression, test_fitness in zip(trees, fitness.tolist()):
+                    self.cache[expression] = test_fitness
+            except Exception as e:
+                logger.warning("Batch hold-out evaluation failed, falling back to per-expression: %s", e)
+        for expression in misses:
+            self(expression)  # 已整批算过的直接命中缓存
+
+
+def annotate_test_fitness(results_path, holdout_fitness):
+    """
+    流式地为结果文件补上 test_fitness，内存占用与行数无关：
+    第一遍只收集不重复的表达式并一次性批量计算 hold-out 适应度，
+    第二遍逐行写入临时文件，最后原子替换原文件。返回 (行数, 不重复表达式数)。
+    """
+    expressions = {}  # 按首次出现顺序，保证测试缓存内容与顺序确定
+    with open(results_path, "r") as f:
+        for line in f:
+            expressions[json.loads(line)["expression"]] = None
+    holdout_fitness.evaluate_many(expressions)
+
+    n_rows = 0
+    tmp_path = results_path + ".tmp"
+    with open(results_path, "r") as src, open(tmp_path, "w") as dst:
+        for line in src:
+            entry = json.loads(line)
+            entry["test_fitness"] = holdout_fitness(entry["expression"])
+            dst.write(json.dumps(entry) + "\n")
+            n_rows += 1
+    os.replace(tmp_path, results_path)
+    return n_rows, len(expressions)
@@ -0,0 +1,158 @@
+import hashlib
+import math
+import os
+import sqlite3
+
+import numpy as np
+
+from utils.readAndwrite import read_json, write_json
+
+_MISSING = object()
+_SQLITE_MAX_VARIABLES = 500  # 单条 SQL 的参数个数上限（保守取值）
+
+
+def dataset_fingerprint(X, y):
+    """ 数据集指纹：对特征矩阵与目标值的形状和内容做哈希，保证不同数据集的缓存互不混用 """
+    digest = hashlib.sha256()
+    for array in (X, y):
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _encode(fitness):
+    # SQLite 会把 NaN 存成 NULL，这里显式约定 NULL 即 NaN
+    fitness = float(fitness)
+    return None if math.isnan(fitness) else fitness
+
+
+def _decode(value):
+    return float("nan") if value is None else value
+
+
+class FitnessStore:
+    """
+    跨实验共享的适应度键值存储（SQLite，WAL 模式）。
+    键为 (数据集指纹, 规范表达式字符串)，支持多进程并发读写，
+    按需读取单条记录，不再需要整文件加载或整文件写回 JSON 缓存。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        dir_path = os.path.dirname(db_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fitness (
+                dataset TEXT NOT NULL,
+                expression TEXT NOT NULL,
+                fitness REAL,
+                PRIMARY KEY (dataset, expression)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    def get_many(self, dataset, expressions):
+        """ 批量查询，返回 {expression: fitness}，不存在的表达式不出现在结果中 """
+        expressions = list(expressions)
+        found = {}
+        for start in range(0, len(expressions), _SQLITE_MAX_VARIABLES):
+            batch = expressions[start:start + _SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT expression, fitness FROM fitness WHERE dataset = ? AND expression IN ({placeholders})",
+                [dataset, *batch],
+            )
+            found.update((expression, _decode(value)) for expression, value in rows)
+        return found
+
+    def put_many(self, dataset, items):
+        """ 在一个事务内批量写入；并发写入同一键时保留先写入的值（同一表达式的适应度是确定的） """
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO fitness (dataset, expression, fitness) VALUES (?, ?, ?)",
+                [(dataset, expression, _encode(fitness)) for expression, fitness in items],
+            )
+
+    def view(self, dataset):
+        return FitnessStoreView(self, dataset)
+
+    def close(self):
+        self._conn.close()
+
+
+class FitnessStoreView:
+    """
+    某个数据集上的缓存视图，提供与 cache_train_fitness 字典相同的用法（in / [] / []= / get）。
+    读取结果在本地保留一份；写入先缓冲，在 flush() 时以一个事务提交。
+    查不到的表达式同样记下，之后的 in / [] 不再逐条查询数据库；
+    prefetch 仍会重新查询它们，以便看到其他进程在此期间写入的结果。
+    """
+
+    def __init__(self, store, dataset):
+        self.store = store
+        self.dataset = dataset
+        self._local = {}
+        self._absent = set()  # 已确认存储中没有的表达式
+        self._pending = {}
+
+    def prefetch(self, expressions):
+        """ 一次查询取回一整代个体的缓存，避免逐条访问数据库 """
+        missing = {expression for expression in expressions if expression not in self._local}
+        if missing:
+            found = self.store.get_many(self.dataset, missing)
+            self._local.update(found)
+            self._absent.difference_update(found)
+            self._absent.update(missing.difference(found))
+
+    def _lookup(self, expression):
+        value = self._local.get(expression, _MISSING)
+        if value is _MISSING and expression not in self._absent:
+            found = self.store.get_many(self.dataset, [expression])
+            if expression in found:
+                value = self._local[expression] = found[expression]
+            else:
+                self._absent.add(expression)
+        return value
+
+    def __contains__(self, expression):
+        return self._lookup(expression) is not _MISSING
+
+    def __getitem__(self, expression):
+        value = self._lookup(expression)
+        if value is _MISSING:
+            raise KeyError(expression)
+        return value
+
+    def get(self, expression, default=None):
+        value = self._lookup(expression)
+        return default if value is _MISSING else value
+
+    def __setitem__(self, expression, fitness):
+        self._local[expression] = fitness
+        self._absent.discard(expression)
+        self._pending[expression] = fitness
+
+    def flush(self):
+        if self._pending:
+            self.store.put_many(self.dataset, self._pending.items())
+            self._pending = {}
+
+
+def open_fitness_cache(fitness_store, cache_path, X, y):
+    """ 传入共享存储时返回该数据集上的缓存视图，否则按原方式整文件读取 JSON 缓存 """
+    if fitness_store is not None:
+        return fitness_store.view(dataset_fingerprint(X, y))
+    return read_json(cache_path)
+
+
+def save_fitness_cache(cache_path, cache):
+    """ 缓存视图只提交缓冲的新条目；普通字典整文件写回 JSON """
+    if isinstance(cache, FitnessStoreView):
+        cache.flush()
+    else:
+        write_json(cache_path, cache)
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# 当前线程正在处理的请求位置，由 llm_request 设置
+_request = threading.local()
+
+
+@contextmanager
+def llm_request(*position):
+    """
+    标记当前线程中的 LLM 调用属于哪个请求位置（如 (代数, "crossover", 下标)）。
+    CachedLLMInterface(reuse=False) 在作用域内按位置而不是完成顺序决定样本编号，
+    并发请求重放时每个个体仍对应原来的缓存样本。
+    """
+    previous = getattr(_request, "state", None)
+    _request.state = (position, {})
+    try:
+        yield
+    finally:
+        _request.state = previous
+
+
+class LLMResponseCache:
+    """
+    基于 SQLite 的持久化 LLM 响应缓存（内容寻址）。
+    键为 (model, temperature, prompt, sample_index) 的哈希；总大小超过 max_bytes 时
+    按最近访问时间淘汰最旧的响应。多个进程可共享同一个数据库文件。
+    """
+
+    def __init__(self, db_path, max_bytes=512 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        dir_path = os.path.dirname(db_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                temperature REAL,
+                sample_index INTEGER,
+                prompt TEXT,
+                response TEXT,
+                size INTEGER,
+                last_access REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access)")
+        self._conn.commit()
+        # **缓存总字节数：打开时统计一次，之后随 put / 淘汰增减，避免每次写入都全表求和**
+        self._nbytes = self._total_bytes()
+
+    @staticmethod
+    def make_key(model, temperature, prompt, sample_index):
+        payload = json.dumps([model, float(temperature), prompt, int(sample_index)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def put(self, key, model, temperature, prompt, sample_index, response):
+        text = json.dumps(response, ensure_ascii=False)
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, float(temperature), int(sample_index), prompt, text, size, time.time()),
+            )
+            self._nbytes += size - (old[0] if old is not None else 0)
+            self._evict_if_needed()
+            self._conn.commit()
+
+    def _evict_if_needed(self):
+        """
+        超出容量时按最近访问时间淘汰，直到降到 max_bytes 的 90%。
+        本地计数只含本进程的写入，超限时先重新统计一次，计入共享同一数据库的其他进程的增删。
+        """
+        if self._nbytes <= self.max_bytes:
+            return
+        self._nbytes = self._total_bytes()
+        if self._nbytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if self._nbytes <= target:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._nbytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            entries, nbytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": entries, "nbytes": nbytes, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedLLMInterface:
+    """
+    给任意 LLM 接口（提供 predict_text_logged）加上持久化响应缓存。
+    reuse=True：相同 prompt 总是复用同一个缓存答案；
+    reuse=False：在 llm_request 作用域内，样本编号由请求位置与该位置上相同 prompt 的第 k 次调用决定，
+    与并发请求的完成顺序无关；作用域外（串行调用）则为同一进程内相同 prompt 的第 k 次请求。
+    既保留多样性，重复实验时又能命中同一批缓存样本，不再消耗 token。
+    """
+
+    def __init__(self, llm_interface, cache, reuse=True):
+        self.llm_interface = llm_interface
+        self.cache = cache
+        self.reuse = reuse
+        self.model = getattr(llm_interface, "model", type(llm_interface).__name__)
+        self._sample_counts = {}
+        self._lock = threading.Lock()
+
+    def _sample_index(self, temp, prompt):
+        if self.reuse:
+            return 0
+        state = getattr(_request, "state", None)
+        if state is not None:
+            position, calls = state  # 只属于当前线程，无需加锁
+            k = calls.get((temp, prompt), 0)
+            calls[(temp, prompt)] = k + 1
+            digest = hashlib.sha256(json.dumps([list(position), k]).encode("utf-8")).digest()
+            return int.from_bytes(digest[:8], "big") >> 1  # SQLite INTEGER 范围内的非负整数
+        with self._lock:
+            index = self._sample_counts.get((temp, prompt), 0)
+            self._sample_counts[(temp, prompt)] = index + 1
+        return index
+
+    def predict_text_logged(self, prompt, temp=1):
+        sample_index = self._sample_index(temp, prompt)
+        key = self.cache.make_key(self.model, temp, prompt, sample_index)
+
+        start_query = time.perf_counter()
+        cached = self.cache.get(key)
+        if cached is not None:
+            # 命中缓存：没有消耗 token，耗时只有本地查询
+            return {
+                "prompt": prompt,
+                "content": cached["content"],
+                "n_prompt_tokens": 0,
+                "n_completion_tokens": 0,
+                "response_time": time.perf_counter() - start_query,
+                "cached": True,
+            }
+
+        response = self.llm_interface.predict_text_logged(prompt, temp=temp)
+        self.cache.put(key, self.model, temp, prompt, sample_index, {
+            "content": response["content"],
+            "n_prompt_tokens": response["n_prompt_tokens"],
+            "n_completion_tokens": response["n_completion_tokens"],
+        })
+        return dict(response, cached=False)
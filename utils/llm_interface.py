@@ -0,0 +1,159 @@
+import ast
+import json
+import math
+import random
+import re
+import threading
+import time
+
+
+class LLMInterface:
+    """
+    LLM 提供方接口。实现类需要提供 predict_text_logged(prompt, temp)，返回
+    {"prompt", "content", "n_prompt_tokens", "n_completion_tokens", "response_time"}。
+    """
+
+    model = "unknown"
+
+    def predict_text_logged(self, prompt, temp=1):
+        raise NotImplementedError
+
+
+# 离线替身生成表达式时使用的符号（与 llm_evolutionary_operators 中的 constraints / terminals 一致）
+_BINARY_OPS = ["+", "-", "*", "/"]
+_UNARY_FUNCS = ["sqrt", "square", "sin", "cos"]
+_TERMINALS = ["x1", "x2", "1", "-1"]
+
+
+class OfflineLLMInterface(LLMInterface):
+    """
+    离线、可复现的 LLM 替身，用于无网络环境下的压测与吞吐量测量。
+    根据 prompt 判断是初始化、交叉还是变异请求，返回 check_response_* 能解析的 JSON：
+    交叉对两个父代做真实的子树交换，变异把一个子树替换为随机子表达式；批量请求逐个任务作答。
+    响应延迟服从对数正态分布（中位数 latency_median、形状参数 latency_sigma，sigma=0 即固定延迟），
+    并按 failure_rate 返回无法解析的响应，以触发调用方的回退逻辑。
+    每次响应的随机数由 (seed, prompt, 该 prompt 的第几次请求) 决定，与并发调度顺序无关。
+    """
+
+    model = "offline-standin"
+
+    def __init__(self, latency_median=1.0, latency_sigma=0.5, failure_rate=0.05, max_depth=3, seed=None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.max_depth = max_depth
+        self.seed = seed
+        self._prompt_counts = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def _rng(self):
+        return self._local.rng
+
+    def predict_text_logged(self, prompt, temp=1):
+        start_query = time.perf_counter()
+        with self._lock:
+            occurrence = self._prompt_counts.get(prompt, 0)
+            self._prompt_counts[prompt] = occurrence + 1
+        self._local.rng = random.Random(f"{self.seed}:{occurrence}:{prompt}")
+        latency = self._sample_latency()
+        content = self._respond(prompt)
+        time.sleep(latency)
+        return {
+            "prompt": prompt,
+            "content": content,
+            "n_prompt_tokens": len(prompt) // 4,
+            "n_completion_tokens": len(content) // 4,
+            "response_time": time.perf_counter() - start_query,
+        }
+
+    def _sample_latency(self):
+        if self.latency_median <= 0:
+            return 0.0
+        return self.latency_median * math.exp(self.latency_sigma * self._rng.gauss(0, 1))
+
+    def _respond(self, prompt):
+        if self._rng.random() < self.failure_rate:
+            return self._rng.choice(["Sorry, I cannot help with that.", '{"expressions": [', "```json\n{}\n```"])
+
+        if '"results"' in prompt:
+            return json.dumps({"results": self._respond_batch(prompt)})
+        if '"expressions"' in prompt:
+            parents = re.search(r"mathematical expressions (.+?) and (.+?)\.\s*\n", prompt)
+            children = self._crossover(parents.group(1), parents.group(2)) if parents else \
+                [self._random_expression(self.max_depth), self._random_expression(self.max_depth)]
+            return json.dumps({"expressions": children})
+        if '"new_expression"' in prompt:
+            parent = re.search(r"Given the expression:\s*(.+?)\s*\n", prompt)
+            child = self._mutate(parent.group(1)) if parent else self._random_expression(self.max_depth)
+            return json.dumps({"new_expression": child})
+        return json.dumps({"expression": self._random_expression(self.max_depth)})
+
+    def _respond_batch(self, prompt):
+        """ 批量请求：逐个任务作答，并按 failure_rate 随机漏掉单个槽位以触发逐槽位回退 """
+        tasks = [json.loads(line) for line in prompt.splitlines() if line.startswith('{"id"')]
+        results = []
+        for task in tasks:
+            if self._rng.random() < self.failure_rate:
+                continue
+            if "expressions" in task:
+                results.append({"id": task["id"], "expressions": self._crossover(*task["expressions"])})
+            else:
+                results.append({"id": task["id"], "new_expression": self._mutate(task["expression"])})
+        return results
+
+    def _random_expression(self, depth):
+        if depth <= 0 or self._rng.random() < 0.3:
+            if self._rng.random() < 0.2:
+                return str(round(self._rng.uniform(0, 1), 2))
+            return self._rng.choice(_TERMINALS)
+        if self._rng.random() < 0.3:
+            return f"{self._rng.choice(_UNARY_FUNCS)}({self._random_expression(depth - 1)})"
+        left = self._random_expression(depth - 1)
+        right = self._random_expression(depth - 1)
+        return f"({left} {self._rng.choice(_BINARY_OPS)} {right})"
+
+    @staticmethod
+    def _subtrees(tree):
+        """ 所有可替换的子表达式（排除函数调用中的函数名） """
+        func_names = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+        return [node for node in ast.walk(tree) if isinstance(node, ast.expr) and id(node) not in func_names]
+
+    @staticmethod
+    def _replace(tree, target, replacement):
+        class _Replacer(ast.NodeTransformer):
+            def visit(self, node):
+                if node is target:
+                    return replacement
+                return self.generic_visit(node)
+        return ast.unparse(_Replacer().visit(tree))
+
+    def _crossover(self, expr1, expr2):
+        """ 单点交叉：随机各选一个子表达式并互换 """
+        try:
+            tree1, tree2 = ast.parse(expr1, mode="eval"), ast.parse(expr2, mode="eval")
+        except SyntaxError:
+            return [self._random_expression(self.max_depth), self._random_expression(self.max_depth)]
+        node1 = self._rng.choice(self._subtrees(tree1))
+        node2 = self._rng.choice(self._subtrees(tree2))
+        return [self._replace(tree1, node1, node2), self._replace(tree2, node2, node1)]
+
+    def _mutate(self, expression):
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError:
+            return self._random_expression(self.max_depth)
+        target = self._rng.choice(self._subtrees(tree))
+        replacement = ast.parse(self._random_expression(2), mode="eval").body
+        return self._replace(tree, target, replacement)
+
+
+def create_llm_interface(provider="qwen", **kwargs):
+    """ 按名称创建 LLM 接口：qwen 为远程接口，offline 为本地离线替身 """
+    if provider == "offline":
+        return OfflineLLMInterface(**kwargs)
+    if provider == "qwen":
+        from utils.openai_interface import OpenAIInterface  # 按需导入，离线环境无需 openai 连接
+        return OpenAIInterface()
+    raise ValueError(f"❌ 未知的 LLM provider: {provider}（可选 qwen / offline）")
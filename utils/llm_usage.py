@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.readAndwrite import ensure_directory_exists, write_json
+
+
+def llm_usage_paths(results_path):
+    """ 逐次调用记录与汇总统计，与结果文件放在一起 """
+    stem = os.path.splitext(results_path)[0]
+    return stem + ".llm_calls.jsonl", stem + ".llm_usage.json"
+
+
+def _latency_percentiles(latencies):
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def _summarize(records):
+    prompt_tokens = sum(r["prompt_tokens"] for r in records)
+    completion_tokens = sum(r["completion_tokens"] for r in records)
+    total_tokens = prompt_tokens + completion_tokens
+    useful = sum(r["within_height"] for r in records)
+    return {
+        "calls": len(records),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency": _latency_percentiles([r["latency"] for r in records]),
+        "slots": sum(r["slots"] for r in records),
+        "parsed": sum(r["parsed"] for r in records),
+        "valid": sum(r["valid"] for r in records),
+        "within_height": useful,
+        "fallback": sum(r["slots"] - r["within_height"] for r in records),
+        "useful_offspring_per_1k_tokens": 1000 * useful / total_tokens if total_tokens else None,
+    }
+
+
+class LLMUsageTracker:
+    """
+    按调用点（init / crossover / mutation）记录每次 LLM 请求的 token、延迟与产出：
+    slots 为本次请求应产出的表达式个数，parsed / valid / within_height 依次为
+    能解析、通过 is_valid_expression、未超过 HEIGHT_LIMIT 的个数，其余槽位回退到父代。
+    请求在线程池中并发执行，同一线程内“最近一次调用”用 thread-local 保存，
+    解析与树高检查在同一线程内完成后再补全该记录。
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.records = []
+        self.generation = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record_call(self, call_site, response, slots=1):
+        record = {
+            "generation": self.generation,
+            "call_site": call_site,
+            "prompt_tokens": response.get("n_prompt_tokens", 0),
+            "completion_tokens": response.get("n_completion_tokens", 0),
+            "latency": response.get("response_time", 0.0),
+            "slots": slots,
+            "parsed": 0,
+            "valid": 0,
+            "within_height": 0,
+        }
+        with self._lock:
+            self.records.append(record)
+        self._local.last = record
+
+    def update_last(self, **counts):
+        """ 补全当前线程最近一次调用的 parsed / valid / within_height """
+        record = getattr(self._local, "last", None)
+        if record is not None:
+            record.update(counts)
+
+    def discount_last(self, n):
+        """ 解析有效、但在树高检查或转换时回退到父代的子代，从 within_height 中扣除 """
+        record = getattr(self._local, "last", None)
+        if record is not None and n:
+            record["within_height"] = max(0, record["within_height"] - n)
+
+    def summary(self):
+        with self._lock:
+            records = list(self.records)
+        tokens_per_generation = {}
+        for r in records:
+            key = str(r["generation"])
+            tokens_per_generation[key] = tokens_per_generation.get(key, 0) + r["prompt_tokens"] + r["completion_tokens"]
+        summary = _summarize(records)
+        summary["by_call_site"] = {site: _summarize([r for r in records if r["call_site"] == site])
+                                   for site in sorted({r["call_site"] for r in records})}
+        summary["tokens_per_generation"] = tokens_per_generation
+        return summary
+
+    def write(self, results_path):
+        calls_path, usage_path = llm_usage_paths(results_path)
+        ensure_directory_exists(calls_path)
+        with open(calls_path, "w") as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+        summary = self.summary()
+        write_json(usage_path, summary)
+        return summary
+
+
+class NullLLMUsageTracker:
+    """ 未启用统计时的空实现 """
+
+    enabled = False
+    generation = None
+
+    def record_call(self, call_site, response, slots=1):
+        pass
+
+    def update_last(self, **counts):
+        pass
+
+    def discount_last(self, n):
+        pass
+
+
+NULL_LLM_USAGE_TRACKER = NullLLMUsageTracker()
+_current_tracker = NULL_LLM_USAGE_TRACKER
+
+
+def get_llm_usage_tracker():
+    return _current_tracker
+
+
+def set_llm_usage_tracker(tracker):
+    global _current_tracker
+    _current_tracker = tracker if tracker is not None else NULL_LLM_USAGE_TRACKER
@@ -0,0 +1,137 @@
+import json
+import os
+import queue
+import threading
+
+from utils.readAndwrite import ensure_directory_exists, read_json
+
+
+class AppendOnlyLogWriter:
+    """
+    后台线程批量追加写 JSONL 日志。
+    append() 只把记录放入队列立即返回；后台线程把队列中积压的记录按文件合并为一次 write，
+    每批写完都 flush（fsync=True 时再 fsync）。每条记录占完整一行，
+    进程崩溃最多留下一行不完整的尾部，由 repair_jsonl_tail 在下次打开时截掉。
+    """
+
+    def __init__(self, fsync=False):
+        self.fsync = fsync
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="AppendOnlyLogWriter", daemon=True)
+        self._thread.start()
+
+    def append(self, file_path, records):
+        self._raise_if_failed()
+        records = list(records)
+        if records:
+            self._queue.put((file_path, records))
+
+    def flush(self):
+        """ 阻塞直到队列中所有记录都已写入磁盘 """
+        self._queue.join()
+        self._raise_if_failed()
+
+    def close(self):
+        if not self._thread.is_alive():
+            return  # 已关闭：出错路径上可能再次调用
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError(f"❌ 日志后台写入失败: {self._error}")
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            # **合并当前积压的所有记录，按文件批量写入**
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(item is None for item in items)
+            batches = {}
+            for item in items:
+                if item is not None:
+                    file_path, records = item
+                    batches.setdefault(file_path, []).extend(records)
+
+            try:
+                for file_path, records in batches.items():
+                    self._write(file_path, records)
+            except Exception as e:
+                self._error = e
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, file_path, records):
+        ensure_directory_exists(file_path)
+        data = "".join(json.dumps(record) + "\n" for record in records)
+        with open(file_path, "a") as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+
+def repair_jsonl_tail(file_path):
+    """ 截掉崩溃时可能残留的不完整最后一行，保证文件只包含完整记录 """
+    if not os.path.exists(file_path):
+        return
+    with open(file_path, "rb+") as f:
+        pos = f.seek(0, os.SEEK_END)
+        if pos == 0:
+            return
+        f.seek(pos - 1)
+        if f.read(1) == b"\n":
+            return
+        # 从文件尾向前分块查找最后一个换行符
+        while pos > 0:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            index = f.read(step).rfind(b"\n")
+            if index >= 0:
+                f.truncate(pos + index + 1)
+                return
+        f.truncate(0)
+
+
+def fitness_cache_journal_path(cache_path):
+    """ 适应度缓存的增量日志：每行一个新条目，与 JSON 缓存文件放在一起 """
+    return os.path.splitext(cache_path)[0] + ".journal.jsonl"
+
+
+def read_fitness_cache(cache_path):
+    """ 读取 JSON 缓存，并回放增量日志中尚未合并的新条目 """
+    cache = read_json(cache_path)
+    journal_path = fitness_cache_journal_path(cache_path)
+    if os.path.exists(journal_path):
+        repair_jsonl_tail(journal_path)
+        with open(journal_path, "r") as f:
+            for line in f:
+                entry = json.loads(line)
+                cache[entry["expression"]] = entry["fitness"]
+    return cache
+
+
+def compact_fitness_cache(cache_path, cache):
+    """ 运行结束时把缓存完整写回一次 JSON（先写临时文件再原子替换），并删除增量日志 """
+    ensure_directory_exists(cache_path)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, cache_path)
+
+    journal_path = fitness_cache_journal_path(cache_path)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
@@ -0,0 +1,17 @@
+import logging
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# **HTTP 客户端在 INFO 级别会逐次记录请求，与逐个体输出一样刷屏**
+NOISY_LOGGERS = ("httpx", "httpcore", "openai")
+
+
+def setup_logging(level="INFO"):
+    """
+    配置根日志级别：INFO 每代只输出一行汇总；DEBUG 额外输出逐个体、逐次 LLM 调用的明细；
+    WARNING 及以上只保留异常信息，适合长时间的正式运行。
+    """
+    level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+    logging.basicConfig(level=level, format=LOG_FORMAT, force=True)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(max(level, logging.WARNING))
@@ -1,8 +1,13 @@
+import logging
 import time
 
 from openai import OpenAI
 import os
 
+from utils.llm_interface import LLMInterface
+
+logger = logging.getLogger(__name__)
+
 qwen_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 # qwen_api = os.environ.get("DASHSCOPE_API_KEY", None)
 qwen_api = "sk-a4c8d17b5eba495e8e6cca04804f4320"
@@ -12,8 +17,9 @@ deepseek_url = "https://api.deepseek.com/v1"
 deepseek_api = os.environ.get("DEEPSEEK_API_KEY", None)
 deepseek_model = "deepseek-chat"
 
-class OpenAIInterface:
+class OpenAIInterface(LLMInterface):
     def __init__(self):
+        self.model = qwen_model
         self.client = OpenAI(api_key=qwen_api,base_url=qwen_url)
         # self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY", None))
         # self.client = OpenAI(api_key='ollama',
@@ -29,15 +35,15 @@ class OpenAIInterface:
 
         message = [{"role": "user", "content": prompt}]
         response = self.client.chat.completions.create(
-            model="qwen-plus", messages=message, temperature=temp
+            model=self.model, messages=message, temperature=temp
         )
-        print(response.model)
+        logger.debug("model: %s", response.model)
         n_prompt_tokens = response.usage.prompt_tokens
         n_completion_tokens = response.usage.completion_tokens
         # end_query = time.perf_counter()
-        print(f"response.choices[0]:{response.choices[0]}")
+        logger.debug("response.choices[0]:%s", response.choices[0])
         content = response.choices[0].message.content
-        print(f"content:{content}")
+        logger.debug("content:%s", content)
         end_query = time.perf_counter()
 
         response_time = end_query - start_query
@@ -60,15 +66,15 @@ class OpenAIInterface:
 
         message = [{"role": "user", "content": prompt}]
         response = self.client.chat.completions.create(
-            model="qwen-plus", messages=message, temperature=temp
+            model=self.model, messages=message, temperature=temp
         )
         # print(response.model)
         n_prompt_tokens = response.usage.prompt_tokens
         n_completion_tokens = response.usage.completion_tokens
         # end_query = time.perf_counter()
-        print(f"response.choices[0]:{response.choices[0]}")
+        logger.debug("response.choices[0]:%s", response.choices[0])
         content = response.choices[0].message.content
-        print(f"content:{content}")
+        logger.debug("content:%s", content)
         end_query = time.perf_counter()
 
         response_time = end_query - start_query
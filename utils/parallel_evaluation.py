@@ -0,0 +1,123 @@
+import functools
+import heapq
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from deap import gp
+
+from utils.compile_cache import CompiledExpressionCache
+from utils.evaluation import evalTrainFitness
+
+# 子进程内的评估环境，由 _init_worker 在每个进程启动时设置一次
+_worker_state = {}
+
+
+def _init_worker(pset_factory, evaluate, X_train, y_train):
+    """ 子进程初始化：pset 含 lambda（临时常数），无法 pickle，只能在子进程内重新构建 """
+    pset = pset_factory()
+    bind_pset = getattr(getattr(evaluate, "func", evaluate), "bind_pset", None)
+    if bind_pset is not None:
+        bind_pset(pset)  # 依赖 pset 的评估器（如 SubtreeMemoEvaluator）跨进程时只传配置，在这里绑定
+    _worker_state["pset"] = pset
+    _worker_state["evaluate"] = evaluate
+    _worker_state["X_train"] = X_train
+    _worker_state["y_train"] = y_train
+    _worker_state["compile"] = CompiledExpressionCache(pset)
+
+
+def _evaluate_chunk(expressions):
+    """ 在子进程内计算一批表达式的训练适应度，返回顺序与输入一致 """
+    pset = _worker_state["pset"]
+    X_train, y_train = _worker_state["X_train"], _worker_state["y_train"]
+    compile_func = _worker_state["compile"]
+    evaluate = _worker_state["evaluate"]
+    if getattr(evaluate, "func", evaluate) is evalTrainFitness:
+        # 编译缓存直接接受表达式字符串，省去 PrimitiveTree.from_string
+        return [float(evaluate(expression, pset, X_train, y_train, compile_func)) for expression in expressions]
+    return [float(evaluate(gp.PrimitiveTree.from_string(expression, pset), pset, X_train, y_train, compile_func))
+            for expression in expressions]
+
+
+def _check_picklable(obj, what):
+    try:
+        pickle.dumps(obj)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        raise ValueError(f"❌ 并行评估需要可 pickle 的 {what}（模块级函数或可序列化对象）: {e}") from e
+
+
+def pset_signature(pset):
+    """ 原语、终结符与参数名：用于确认子进程重建的 pset 与主进程一致 """
+    return sorted(pset.mapping), list(pset.arguments)
+
+
+def balanced_chunks(sized_items, n_chunks):
+    """
+    按树大小做负载均衡（最长处理时间优先的贪心分配）。
+    sized_items: [(item, size), ...]；分配结果只依赖输入顺序，保证可复现。
+    """
+    n_chunks = max(1, min(n_chunks, len(sized_items)))
+    chunks = [[] for _ in range(n_chunks)]
+    loads = [(0, i) for i in range(n_chunks)]
+    heapq.heapify(loads)
+    for item, size in sorted(sized_items, key=lambda pair: -pair[1]):
+        load, i = heapq.heappop(loads)
+        chunks[i].append(item)
+        heapq.heappush(loads, (load + size, i))
+    return [chunk for chunk in chunks if chunk]
+
+
+class ParallelFitnessEvaluator:
+    """
+    进程池并行计算训练适应度。
+    通过 toolbox.map 只分发缓存未命中的表达式，结果按表达式在种群中首次出现的顺序
+    写回 cache_train_fitness，保证给定随机种子时运行结果可复现。
+    子进程用 pset_factory 重建 pset，并调用与串行相同的评估器 evaluate（通常传 toolbox.evaluate），
+    两者都必须可 pickle；传入 pset 时检查 pset_factory 构建的 pset 与之一致。
+    """
+
+    def __init__(self, pset_factory, X_train, y_train, n_workers, evaluate=evalTrainFitness, pset=None,
+                 chunks_per_worker=4):
+        if isinstance(evaluate, functools.partial):
+            # toolbox.register 会把被包装对象的 __dict__（含 pset）复制到 partial 上，重新包装后只保留函数与参数
+            evaluate = functools.partial(evaluate.func, *evaluate.args, **evaluate.keywords)
+        _check_picklable(pset_factory, "pset_factory")
+        _check_picklable(evaluate, "评估器")
+        if pset is not None and pset_signature(pset_factory()) != pset_signature(pset):
+            raise ValueError("❌ pset_factory 构建的 pset 与当前 pset 不一致，子进程的适应度将与串行评估不同")
+        self.n_workers = n_workers
+        self.n_chunks = n_workers * chunks_per_worker
+        self.executor = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                            initargs=(pset_factory, evaluate, X_train, y_train))
+
+    def map(self, func, iterable):
+        return self.executor.map(func, iterable)
+
+    def evaluate_misses(self, map_func, population, cache_train_fitness, dedup=None):
+        """
+        并行计算 population 中未命中缓存的表达式，返回新写入缓存的表达式列表。
+        传入 dedup（SemanticDeduplicator）时只分发各语义指纹的代表表达式，其余留给串行循环共享适应度。
+        """
+        misses = {}
+        for ind in population:
+            expression = str(ind)
+            if expression not in cache_train_fitness and expression not in misses:
+                misses[expression] = len(ind)
+        if dedup is not None:
+            misses = {expression: misses[expression] for expression in dedup.representatives(misses)}
+        if not misses:
+            return []
+
+        chunks = balanced_chunks(list(misses.items()), self.n_chunks)
+        fitness = {}
+        for chunk, values in zip(chunks, map_func(_evaluate_chunk, chunks)):
+            fitness.update(zip(chunk, values))
+
+        # **按首次出现顺序合并，保证缓存内容与顺序确定**
+        for expression in misses:
+            cache_train_fitness[expression] = fitness[expression]
+            if dedup is not None:
+                dedup.record(expression, fitness[expression])
+        return list(misses)
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,123 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from utils.readAndwrite import ensure_directory_exists
+
+
+def metrics_path(results_path):
+    """ 每代指标文件与结果文件放在一起：holdout_*.jsonl -> holdout_*.metrics.jsonl """
+    return os.path.splitext(results_path)[0] + ".metrics.jsonl"
+
+
+class GenerationProfiler:
+    """
+    每代各阶段的耗时与计数。timer(stage) 累加该阶段耗时，count(name) 累加计数，
+    end_generation() 把本代汇总追加为 metrics 文件中的一行并清零。
+    LLM 调用与表达式校验在线程池中执行，累加操作加锁。
+    并发阶段（如 llm_call）记录的是各次调用耗时之和，可能大于本代墙钟时间。
+    """
+
+    enabled = True
+
+    def __init__(self, file_path, resume_generation=None):
+        ensure_directory_exists(file_path)
+        self.file_path = file_path
+        if resume_generation is not None:
+            # **从检查点恢复：丢弃中断前已写出的、检查点之后各代（及收尾行）的指标，再接着追加**
+            _truncate_metrics(file_path, resume_generation)
+        self._file = open(file_path, "a" if resume_generation is not None else "w")
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._timings = defaultdict(float)
+        self._counters = defaultdict(int)
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            self._timings[stage] += seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def end_generation(self, generation):
+        with self._lock:
+            record = {
+                "generation": generation,
+                "wall_time": time.perf_counter() - self._start,
+                "timings": dict(self._timings),
+                "counters": dict(self._counters),
+            }
+            self._reset()
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        """ 进化循环结束后的收尾阶段（结果写盘等）记为 generation 为 null 的一行 """
+        if self._timings or self._counters:
+            self.end_generation(None)
+        self._file.close()
+
+
+def _truncate_metrics(file_path, generation):
+    """ 只保留 generation 之前各代的指标行 """
+    if not os.path.exists(file_path):
+        return
+    kept = []
+    with open(file_path) as f:
+        for line in f:
+            line_generation = json.loads(line)["generation"] if line.strip() else None
+            if line_generation is not None and line_generation < generation:
+                kept.append(line)
+    with open(file_path, "w") as f:
+        f.writelines(kept)
+
+
+class NullProfiler:
+    """ 关闭时使用的空实现：所有方法立即返回，timer 复用同一个空上下文 """
+
+    enabled = False
+    _null_context = contextlib.nullcontext()
+
+    def timer(self, stage):
+        return self._null_context
+
+    def add_time(self, stage, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def end_generation(self, generation):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+_current_profiler = NULL_PROFILER
+
+
+def get_profiler():
+    """ 当前运行的 profiler；LLM 调用、校验等深层调用点通过它记录，无需逐层传参 """
+    return _current_profiler
+
+
+def set_profiler(profiler):
+    global _current_profiler
+    _current_profiler = profiler if profiler is not None else NULL_PROFILER
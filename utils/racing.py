@@ -0,0 +1,113 @@
+import heapq
+import math
+
+import numpy as np
+
+from utils.evaluation import mean_squared_error, predict_vectorized
+
+
+class RacingEvaluator:
+    """
+    竞速评估：缓存未命中的个体按随机打乱的行顺序，在逐块翻倍增长的样本前缀上计算平方误差，
+    每块之后用部分 MSE 的置信下界（均值 - z * 标准误，带有限总体修正）与本代第 k 好的精确适应度比较，
+    下界已经更差时提前终止，返回部分 MSE（只用于记录）。k 取精英个数：已评估个体上依赖适应度的选择只有
+    selBest(pop, elite_size) 与名人堂（selBest(offspring, ...) 排序的是交叉 / 变异后已删除适应度的子代），
+    被终止的个体以高置信度进不了精英。调用方把其选择用适应度设为 inf：精英与名人堂不会选中它，
+    而 tournsize=1 的父代选择是与适应度无关的随机抽取，inf 不改变其被选为父代的概率。
+    跑完全部样本的个体按原始行顺序计算 MSE，与 evalTrainFitness 的结果逐位一致；
+    近似适应度不写入 cache_train_fitness（与语义去重相同），只在本代内复用。
+    """
+
+    def __init__(self, X_train, y_train, k=1, z=3.0, min_rows=256, growth=2, seed=0):
+        n_rows = len(X_train)
+        # 固定的行顺序：用独立的随机数生成器，不影响进化过程的随机数序列
+        self.order = np.random.RandomState(seed).permutation(n_rows)
+        self.X_train = X_train
+        self.y_train = y_train
+        self.X_shuffled = np.ascontiguousarray(X_train[self.order])
+        self.y_shuffled = np.ascontiguousarray(y_train[self.order])
+        self.k = max(1, k)
+        self.z = z
+        # 块边界：min_rows, min_rows * growth, ...，最后一块补齐到全部样本
+        self.bounds = []
+        stop = min_rows
+        while stop < n_rows:
+            self.bounds.append(stop)
+            stop = int(stop * max(growth, 1.5))
+        self.bounds.append(n_rows)
+        self._best = []       # 本代最好的 k 个精确适应度（取负后的小顶堆）
+        self._aborted = {}    # 本代已提前终止的表达式 -> 部分 MSE
+        self.evaluated = 0
+        self.aborted = 0
+        self.rows_evaluated = 0
+
+    @property
+    def threshold(self):
+        """ 第 k 好的精确适应度；本代精确值不足 k 个时为 inf（不终止任何个体） """
+        return -self._best[0] if len(self._best) >= self.k else math.inf
+
+    def start_generation(self, known_fitness):
+        """ 每代开始时传入已有精确适应度（缓存命中的个体），重置门槛 """
+        self._best = []
+        self._aborted = {}
+        for fitness in known_fitness:
+            self.record(fitness)
+
+    def record(self, fitness):
+        if not math.isfinite(fitness):
+            return
+        if len(self._best) < self.k:
+            heapq.heappush(self._best, -fitness)
+        elif fitness < -self._best[0]:
+            heapq.heapreplace(self._best, -fitness)
+
+    def __call__(self, individual, compile_func):
+        """ 返回 (适应度, 是否精确评估) """
+        expression = str(individual)
+        if expression in self._aborted:
+            return self._aborted[expression], False
+
+        func = compile_func(individual)
+        if self.threshold == math.inf:
+            # **门槛尚未确定（精确值不足 k 个）时不可能终止，直接按原始行顺序全量评估，省去分块开销**
+            fitness = mean_squared_error(predict_vectorized(func, self.X_train), self.y_train)
+            self.rows_evaluated += len(self.y_train)
+            self.evaluated += 1
+            self.record(fitness)
+            return fitness, True
+
+        n_rows = len(self.y_train)
+        predictions = np.empty(n_rows, dtype=np.float64)
+        start, total, total_sq = 0, 0.0, 0.0
+        for stop in self.bounds:
+            block = predict_vectorized(func, self.X_shuffled[start:stop])
+            predictions[self.order[start:stop]] = block
+            self.rows_evaluated += stop - start
+            if stop == n_rows:
+                break
+            with np.errstate(all="ignore"):
+                errors = (block - self.y_shuffled[start:stop]) ** 2
+                total += float(errors.sum())
+                total_sq += float((errors ** 2).sum())
+            start = stop
+            mean = total / stop
+            variance = max(total_sq / stop - mean * mean, 0.0)
+            lower = mean - self.z * math.sqrt(variance / stop * (n_rows - stop) / (n_rows - 1))
+            # 下界非有限（溢出 / NaN）时不据此终止，跑完全部样本得到精确值
+            if math.isfinite(lower) and lower > self.threshold:
+                self.aborted += 1
+                self._aborted[expression] = mean
+                return mean, False
+
+        # **幸存个体：按原始行顺序计算，与全量评估结果一致**
+        fitness = mean_squared_error(predictions, self.y_train)
+        self.evaluated += 1
+        self.record(fitness)
+        return fitness, True
+
+    def stats(self):
+        return {
+            "evaluated": self.evaluated,
+            "aborted": self.aborted,
+            "rows_evaluated": self.rows_evaluated,
+        }
@@ -0,0 +1,85 @@
+import hashlib
+
+import numpy as np
+
+from utils.evaluation import predict_vectorized
+
+
+class SemanticDeduplicator:
+    """
+    语义指纹去重：在训练集中按固定种子随机抽取的探针样本上计算表达式输出，
+    按有效数字取整后哈希作为指纹。add(x1, x2) 与 add(x2, x1)、mul(x1, 1) 与 x1 指纹相同，
+    同一指纹只精确评估一个代表表达式，其余表达式直接共享其适应度。
+    只在探针之外的样本上不同（如保护除法 / 对数的分支）的表达式仍可能被合并，
+    因此共享得到的适应度不写入 cache_train_fitness，结果记录中也标为 "exact": false。
+    """
+
+    def __init__(self, compile_func, X_train, n_probe=64, significant_digits=10, seed=0):
+        # 随机抽取探针行（独立的随机数生成器，不影响进化过程），比等间隔取样更不易漏掉局部的分支差异
+        rows = np.sort(np.random.RandomState(seed).choice(len(X_train), min(n_probe, len(X_train)), replace=False))
+        self.X_probe = np.ascontiguousarray(X_train[rows])
+        self.compile_func = compile_func
+        self.significant_digits = significant_digits
+        self._keys = {}       # expression -> 指纹（无法求值时为 None）
+        self._fitness = {}    # 指纹 -> 代表表达式的精确适应度
+        self.evaluated = 0
+        self.avoided = 0
+
+    def fingerprint(self, expression):
+        expression = str(expression)
+        if expression in self._keys:
+            return self._keys[expression]
+        try:
+            predictions = predict_vectorized(self.compile_func(expression), self.X_probe)
+            text = ";".join(f"{value:.{self.significant_digits}g}" for value in predictions)
+            key = hashlib.sha1(text.encode()).hexdigest()
+        except Exception:
+            key = None  # 探针上出错的表达式不参与去重，交给精确评估处理
+        self._keys[expression] = key
+        return key
+
+    def representatives(self, expressions):
+        """ 从一批未命中缓存的表达式中挑出需要精确评估的代表：指纹未见过且在本批中首次出现 """
+        selected = []
+        seen = set()
+        for expression in expressions:
+            key = self.fingerprint(expression)
+            if key is None:
+                selected.append(expression)
+            elif key not in self._fitness and key not in seen:
+                seen.add(key)
+                selected.append(expression)
+        return selected
+
+    def record(self, expression, fitness):
+        """ 记录代表表达式的精确适应度 """
+        self.evaluated += 1
+        key = self.fingerprint(expression)
+        if key is not None:
+            self._fitness.setdefault(key, fitness)
+
+    def __call__(self, individual, evaluate):
+        """ 返回 (适应度, 是否精确评估)；同指纹已评估过时不调用 evaluate """
+        key = self.fingerprint(individual)
+        if key is not None and key in self._fitness:
+            self.avoided += 1
+            return self._fitness[key], False
+        fitness = evaluate()
+        self.record(individual, fitness)
+        return fitness, True
+
+    def state(self):
+        """ 检查点中保存的状态：指纹 -> 精确适应度，以及计数 """
+        return {"fitness": dict(self._fitness), "evaluated": self.evaluated, "avoided": self.avoided}
+
+    def load_state(self, state):
+        self._fitness = dict(state["fitness"])
+        self.evaluated = state["evaluated"]
+        self.avoided = state["avoided"]
+
+    def stats(self):
+        return {
+            "fingerprints": len(self._fitness),
+            "evaluated": self.evaluated,
+            "avoided": self.avoided,
+        }
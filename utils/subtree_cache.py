@@ -0,0 +1,116 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.evaluation import mean_squared_error
+
+
+class SubtreeMemoEvaluator:
+    """
+    子树级语义缓存评估器，可作为 evalTrainFitness 的替代注册到 toolbox.evaluate。
+
+    同一种群中的个体经过交叉、变异后共享大量子树（如 sin(x1)、square(x2)）。
+    这里按结构（子树的规范字符串）对子树做哈希，每个数据集上每个不同子树只计算一次，
+    输出向量存入按字节数限制的 LRU 缓存，父节点直接由子节点的缓存向量组合得到。
+    逐节点调用的仍是 pset 中的同一批原语，结果与编译后整体求值完全一致。
+    """
+
+    def __init__(self, pset, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bind_pset(pset)
+        self._store = OrderedDict()  # (dataset_key, subtree_key) -> 输出向量
+        self._nbytes = 0
+        self._datasets = {}  # id(X) -> (X, dataset_key)，持有 X 的引用以免 id 被复用
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind_pset(self, pset):
+        self.pset = pset
+        self._arg_index = {name: i for i, name in enumerate(pset.arguments)} if pset is not None else {}
+
+    def __getstate__(self):
+        """ 跨进程只传递配置：pset 含 lambda 无法 pickle，子进程用 bind_pset 绑定重建的 pset，缓存从空开始 """
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(None, state["max_bytes"])
+
+    def __call__(self, individual, pset, X, y, compile_func=None):
+        """ 与 evalTrainFitness 相同的调用方式，返回该数据集上的 MSE """
+        return mean_squared_error(self.predict(individual, X), y)
+
+    def predict(self, individual, X):
+        dataset_key = self._dataset_key(X)
+        keys, children = self._subtree_keys(individual)
+
+        def evaluate(i):
+            node = individual[i]
+            if node.arity == 0:
+                arg = self._arg_index.get(keys[i])  # 参数终结符的规范字符串即参数名
+                return X[:, arg] if arg is not None else node.value
+
+            store_key = (dataset_key, keys[i])
+            cached = self._store.get(store_key)
+            if cached is not None:
+                self._store.move_to_end(store_key)
+                self.hits += 1
+                return cached
+
+            self.misses += 1
+            args = [evaluate(j) for j in children[i]]
+            with np.errstate(all="ignore"):
+                value = self.pset.context[node.name](*args)
+            self._put(store_key, value)
+            return value
+
+        predictions = evaluate(0)
+        # 常数表达式只得到标量，需要广播到样本数
+        return np.broadcast_to(np.asarray(predictions, dtype=float), (X.shape[0],))
+
+    def _subtree_keys(self, individual):
+        """ 逆序扫描前缀序列，得到每个节点的子树规范字符串与子节点下标 """
+        keys = [None] * len(individual)
+        children = [()] * len(individual)
+        stack = []
+        for i in range(len(individual) - 1, -1, -1):
+            node = individual[i]
+            if node.arity == 0:
+                keys[i] = node.format()
+            else:
+                # 逆序入栈，第一个参数位于栈顶
+                args = tuple(stack.pop() for _ in range(node.arity))
+                children[i] = args
+                keys[i] = node.format(*(keys[j] for j in args))
+            stack.append(i)
+        return keys, children
+
+    def _dataset_key(self, X):
+        entry = self._datasets.get(id(X))
+        if entry is None:
+            digest = hashlib.sha1(np.ascontiguousarray(X).tobytes()).hexdigest()
+            entry = (X, f"{X.shape}:{digest}")
+            self._datasets[id(X)] = entry
+        return entry[1]
+
+    def _put(self, store_key, value):
+        nbytes = value.nbytes if isinstance(value, np.ndarray) else 8
+        self._store[store_key] = value
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes and len(self._store) > 1:
+            _, evicted = self._store.popitem(last=False)
+            self._nbytes -= evicted.nbytes if isinstance(evicted, np.ndarray) else 8
+            self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "subtrees": len(self._store),
+            "nbytes": self._nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }